@@ -0,0 +1,131 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+
+class TokenCache:
+    """
+    Tokens with their users in a bounded per-process LRU with a TTL, or
+    only in the shared cache when TOKEN_CACHE_SHARED is set.
+
+    Without the shared cache other workers keep their local entry until
+    it expires, so TOKEN_CACHE_TTL bounds how long they may still accept
+    a revoked token or see an outdated user. The shared cache is read on
+    every request instead, so invalidation reaches all workers at once;
+    its entries hold the user without the password hash.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(key):
+        # Raw tokens are credentials, keep them out of cache keys.
+        return "auth-token:" + hashlib.sha256(key.encode()).hexdigest()
+
+    @staticmethod
+    def get_user_fields():
+        return [
+            field
+            for field in User._meta.concrete_fields
+            if field.attname != "password"
+        ]
+
+    def dump(self, token):
+        return {
+            "created": token.created,
+            "user": [
+                getattr(token.user, field.attname)
+                for field in self.get_user_fields()
+            ],
+        }
+
+    def load(self, key, entry):
+        # The password stays deferred and is read from the database only
+        # when something checks it.
+        user = User.from_db(
+            DEFAULT_DB_ALIAS,
+            [field.attname for field in self.get_user_fields()],
+            entry["user"],
+        )
+        token = Token.from_db(
+            DEFAULT_DB_ALIAS,
+            ["key", "user_id", "created"],
+            [key, user.pk, entry["created"]],
+        )
+        token.user = user
+        return token
+
+    def get(self, key):
+        if settings.TOKEN_CACHE_SHARED:
+            entry = cache.get(self.make_key(key))
+            return None if entry is None else self.load(key, entry)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires > now:
+                self._entries.move_to_end(key)
+                return token
+            del self._entries[key]
+        return None
+
+    def set(self, key, token):
+        if settings.TOKEN_CACHE_SHARED:
+            cache.set(
+                self.make_key(key),
+                self.dump(token),
+                settings.TOKEN_CACHE_SHARED_TTL,
+            )
+        else:
+            self.remember(key, token)
+
+    def remember(self, key, token):
+        if settings.TOKEN_CACHE_SIZE <= 0 or settings.TOKEN_CACHE_TTL <= 0:
+            return
+        expires = time.monotonic() + settings.TOKEN_CACHE_TTL
+        with self._lock:
+            self._entries[key] = (token, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if settings.TOKEN_CACHE_SHARED:
+            cache.delete_many([self.make_key(key) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication without the token and user query on cache hits."""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        # Requests may change their user, keep the cached one intact.
+        return copy.copy(token.user), token
@@ -0,0 +1,181 @@
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+CATALOG_TIMEOUT = 60 * 60 * 24
+
+
+class CacheVersion:
+    """
+    Version stamp of a cached dataset kept in the shared cache.
+
+    Cached entries are stored under keys containing the current stamp,
+    so bumping the version invalidates them on every worker at once.
+    """
+
+    def __init__(self, name):
+        self.key = f"{name}-version"
+
+    def get(self):
+        version = cache.get(self.key)
+        if version is None:
+            cache.add(self.key, self.new(), None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        cache.set(self.key, self.new(), None)
+
+    def new(self):
+        return {"etag": uuid.uuid4().hex, "modified": int(time.time())}
+
+
+def get_or_set_versioned(name, version, default):
+    key = f"{name}:{version['etag']}"
+    value = cache.get(key)
+    if value is None:
+        value = default()
+        cache.set(key, value, CATALOG_TIMEOUT)
+    return value
+
+
+def set_validators(response, etag, version):
+    response["ETag"] = quote_etag(etag)
+    response["Last-Modified"] = http_date(version["modified"])
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def not_modified(request, etag, version):
+    """304 response when the client copy is current, None otherwise."""
+    response = get_conditional_response(
+        request, etag=quote_etag(etag), last_modified=version["modified"]
+    )
+    if response is not None:
+        set_validators(response, etag, version)
+    return response
+
+
+class ResponseCache:
+    """
+    Cache of serialized response data for requests that do not depend on
+    the user, stored in the RESPONSE_CACHE_ALIAS backend.
+    """
+
+    stats_keys = {True: "response-cache-hits", False: "response-cache-misses"}
+
+    @property
+    def backend(self):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    def make_key(self, request, *parts):
+        params = sorted(
+            (name, value)
+            for name in request.query_params
+            for value in request.query_params.getlist(name)
+            if value != ""
+        )
+        digest = hashlib.md5(
+            "{}{}?{}".format(
+                request.get_host(), request.path, urlencode(params)
+            ).encode()
+        ).hexdigest()
+        return ":".join(("response", *map(str, parts), digest))
+
+    def get_or_set(self, key, build):
+        data = self.backend.get(key)
+        hit = data is not None
+        self.count(hit)
+        if hit:
+            return Response(data, headers={"X-Cache": "HIT"})
+        response = build()
+        if response.status_code == 200:
+            self.backend.set(
+                key, response.data, settings.RESPONSE_CACHE_TIMEOUT
+            )
+        response["X-Cache"] = "MISS"
+        return response
+
+    def count(self, hit):
+        key = self.stats_keys[hit]
+        self.backend.add(key, 0, None)
+        try:
+            self.backend.incr(key)
+        except ValueError:
+            pass
+
+    def stats(self):
+        hits, misses = (
+            self.backend.get(self.stats_keys[hit], 0) for hit in (True, False)
+        )
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else None,
+        }
+
+
+def recipe_version(pk):
+    return CacheVersion(f"recipe-{pk}")
+
+
+def user_overlay_version(user_id):
+    return CacheVersion(f"user-overlay-{user_id}")
+
+
+def get_user_overlay(user):
+    """
+    Ids of the recipes the user favorited or put in the cart and of the
+    authors the user follows, cached until one of these lists changes.
+    """
+    return get_or_set_versioned(
+        f"user-overlay-{user.pk}",
+        user_overlay_version(user.pk).get(),
+        lambda: {
+            "favorites": set(
+                Favorite.objects.filter(user=user).values_list(
+                    "recipes_id", flat=True
+                )
+            ),
+            "cart": set(
+                ShoppingCart.objects.filter(user=user).values_list(
+                    "recipe_id", flat=True
+                )
+            ),
+            "following": set(
+                Follow.objects.filter(user=user).values_list(
+                    "author_id", flat=True
+                )
+            ),
+        },
+    )
+
+
+def apply_overlay(data, overlay):
+    """Set per-user flags on a shared recipe page or recipe body."""
+    recipes = data["results"] if "results" in data else [data]
+    for recipe in recipes:
+        recipe["is_favorited"] = recipe["id"] in overlay["favorites"]
+        recipe["is_in_shopping_cart"] = recipe["id"] in overlay["cart"]
+        if recipe["author"]:
+            recipe["author"]["is_subscribed"] = (
+                recipe["author"]["id"] in overlay["following"]
+            )
+    return data
+
+
+tags_version = CacheVersion("tags")
+recipe_lists_version = CacheVersion("recipe-lists")
+recipe_relations_version = CacheVersion("recipe-relations")
+response_cache = ResponseCache()
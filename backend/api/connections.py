@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.dispatch import receiver
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """
+    Close persistent connections that were idle for DB_HEALTH_CHECK_IDLE
+    seconds and no longer answer, so that the request reconnects instead
+    of failing on a connection dropped by the server or PgBouncer.
+    Django 3.2 only notices broken connections after an error.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if not connection.settings_dict.get("CONN_HEALTH_CHECKS"):
+            continue
+        idle = now - getattr(connection, "last_used", now)
+        if idle < settings.DB_HEALTH_CHECK_IDLE:
+            continue
+        if not connection.is_usable():
+            connection.close()
+
+
+@receiver(request_finished)
+def mark_connections_used(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used = now
@@ -1,10 +1,27 @@
-import django_filters as filters
+from django.db.models import Exists, OuterRef
+from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+
+from .cache import get_or_set_versioned, tags_version
+
+
+def get_tag_slugs():
+    return get_or_set_versioned(
+        "tag-slugs",
+        tags_version.get(),
+        lambda: sorted(Tag.objects.values_list("slug", flat=True)),
+    )
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    """
+    Recipe filters composed as EXISTS subqueries on the incoming queryset,
+    so they combine freely and never multiply rows.
+    """
+
+    tags = filters.MultipleChoiceFilter(method="filter_tags")
+    author = filters.NumberFilter(field_name="author_id")
     is_favorited = filters.BooleanFilter(method="get_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="get_is_in_shopping_cart"
@@ -14,17 +31,40 @@ class RecipeFilter(filters.FilterSet):
         model = Recipe
         fields = ("is_favorited", "is_in_shopping_cart", "author", "tags")
 
-    def get_is_favorited(self, queryset, name, value):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.filters["tags"].extra["choices"] = [
+            (slug, slug) for slug in get_tag_slugs()
+        ]
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef("pk"), tag__slug__in=value
+                )
+            )
+        )
+
+    def filter_user_relation(self, queryset, model, field, value):
+        if not value:
+            return queryset
         user = self.request.user
-        if value:
-            return Recipe.objects.filter(favorite__user=user)
-        return Recipe.objects.all()
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(
+            Exists(model.objects.filter(user=user, **{field: OuterRef("pk")}))
+        )
+
+    def get_is_favorited(self, queryset, name, value):
+        return self.filter_user_relation(queryset, Favorite, "recipes", value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        user = self.request.user
-        if value:
-            return Recipe.objects.filter(shoppingcart__user=user)
-        return Recipe.objects.all()
+        return self.filter_user_relation(
+            queryset, ShoppingCart, "recipe", value
+        )
 
 
 class IngredientFilter(filters.FilterSet):
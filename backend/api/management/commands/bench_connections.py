@@ -0,0 +1,98 @@
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory, override_settings
+from rest_framework.authtoken.models import Token
+
+from .benchmark import percentile
+
+User = get_user_model()
+
+MODES = (
+    ("connection per request", {"CONN_MAX_AGE": 0}),
+    (
+        "persistent",
+        {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": False},
+    ),
+    (
+        "persistent, checked",
+        {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+    ),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures connect overhead per request with connections closed "
+        "after every request and kept open, with and without health checks"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300)
+        parser.add_argument("--path", default="/api/recipes/")
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by("id").first()
+        if user is None:
+            raise CommandError("There are no users, run seed_data first.")
+        token, _ = Token.objects.get_or_create(user=user)
+        self.environ = (
+            RequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+            .get(options["path"], HTTP_AUTHORIZATION=f"Token {token.key}")
+            .environ
+        )
+        self.handler = WSGIHandler()
+        database = connections["default"]
+        saved = dict(database.settings_dict)
+        self.stdout.write(
+            f"{database.vendor}, {options['requests']} requests of "
+            f"{options['path']}"
+        )
+        try:
+            for label, overrides in MODES:
+                database.close()
+                database.settings_dict.update(overrides)
+                # Check on every request to show the worst case.
+                with override_settings(DB_HEALTH_CHECK_IDLE=0):
+                    self.run(label, database, options["requests"])
+        finally:
+            database.close()
+            database.settings_dict.update(saved)
+
+    def run(self, label, database, count):
+        connects = []
+        connect = database.connect
+
+        @wraps(connect)
+        def timed_connect():
+            started = time.perf_counter()
+            connect()
+            connects.append(time.perf_counter() - started)
+
+        database.connect = timed_connect
+        latencies = []
+        try:
+            for _ in range(count):
+                started = time.perf_counter()
+                response = self.handler(dict(self.environ), self.start)
+                b"".join(response)
+                # Sends request_finished, which may close the connection.
+                response.close()
+                latencies.append(time.perf_counter() - started)
+        finally:
+            del database.connect
+        self.stdout.write(
+            f"{label:>24}: {len(connects)} connects, "
+            f"{sum(connects) * 1000 / count:.3f} ms connecting per "
+            f"request, p50 {percentile(latencies, 0.5) * 1000:.2f} ms, "
+            f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms"
+        )
+
+    def start(self, status, headers):
+        if not status.startswith("200"):
+            raise CommandError(f"The request failed: {status}")
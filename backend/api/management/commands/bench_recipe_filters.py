@@ -0,0 +1,123 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from api.cache import tags_version
+from api.filters import RecipeFilter
+from recipes.models import Favorite, Recipe, Tag
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares JOIN + DISTINCT recipe filtering with RecipeFilter on a "
+        "seeded dataset that is rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=20000)
+        parser.add_argument("--authors", type=int, default=200)
+        parser.add_argument("--tags", type=int, default=10)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            transaction.set_rollback(True)
+        tags_version.bump()
+
+    def seed(self, rng, options):
+        User.objects.bulk_create(
+            User(
+                username=f"bench-author-{number}",
+                email=f"bench-author-{number}@foodgram.test",
+            )
+            for number in range(options["authors"])
+        )
+        authors = list(User.objects.filter(username__startswith="bench-"))
+        Tag.objects.bulk_create(
+            Tag(
+                name=f"bench-tag-{number}",
+                slug=f"bench-tag-{number}",
+                color="#000000",
+            )
+            for number in range(options["tags"])
+        )
+        tags = list(Tag.objects.filter(slug__startswith="bench-tag-"))
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=rng.choice(authors),
+                name=f"bench recipe {number}",
+                text="bench",
+                cooking_time=10,
+            )
+            for number in range(options["recipes"])
+        )
+        recipes = list(
+            Recipe.objects.filter(name__startswith="bench recipe").values_list(
+                "id", flat=True
+            )
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe, tag=tag)
+            for recipe in recipes
+            for tag in rng.sample(tags, rng.randint(1, 3))
+        )
+        user = authors[0]
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipes_id=recipe)
+            for recipe in rng.sample(recipes, len(recipes) // 10)
+        )
+        return user, authors, tags
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        started = time.perf_counter()
+        user, authors, tags = self.seed(rng, options)
+        tags_version.bump()
+        self.stdout.write(
+            f"seeded {options['recipes']} recipes in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+        request = RequestFactory().get("/api/recipes/")
+        request.user = user
+        cases = []
+        for _ in range(options["repeat"]):
+            slugs = [tag.slug for tag in rng.sample(tags, 2)]
+            cases.append((slugs, rng.choice(authors).id))
+
+        def joined(slugs, author):
+            return Recipe.objects.filter(
+                tags__slug__in=slugs,
+                author=author,
+                favorite__user=user,
+            ).distinct()
+
+        def composed(slugs, author):
+            return RecipeFilter(
+                {"tags": slugs, "author": author, "is_favorited": "true"},
+                queryset=Recipe.objects.all(),
+                request=request,
+            ).qs
+
+        for label, build in (
+            ("join + distinct", joined),
+            ("exists", composed),
+        ):
+            started = time.perf_counter()
+            querysets = [build(slugs, author)[:6] for slugs, author in cases]
+            built = time.perf_counter()
+            rows = sum(len(queryset) for queryset in querysets)
+            finished = time.perf_counter()
+            build_ms = (built - started) * 1000 / len(cases)
+            query_ms = (finished - built) * 1000 / len(cases)
+            self.stdout.write(
+                f"{label:>15}: build {build_ms:.2f} ms, query "
+                f"{query_ms:.2f} ms per request, {rows} rows in total"
+            )
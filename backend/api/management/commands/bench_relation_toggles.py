@@ -0,0 +1,120 @@
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.serializers import FavoriteSerializer, ShoppingCartSerializer
+from api.views import FavoriteCreateDeleteView, ShoppingCartCreateDeleteView
+from recipes.images import render_renditions
+from recipes.models import Recipe
+from recipes.storage import image_storage
+
+User = get_user_model()
+
+
+class Base64FavoriteSerializer(FavoriteSerializer):
+    image = Base64ImageField(
+        read_only=True, source="recipes.image", represent_in_base64=True
+    )
+
+
+class Base64ShoppingCartSerializer(ShoppingCartSerializer):
+    image = Base64ImageField(
+        read_only=True, source="recipe.image", represent_in_base64=True
+    )
+
+
+CASES = (
+    (
+        "favorite, inline base64",
+        FavoriteCreateDeleteView,
+        Base64FavoriteSerializer,
+    ),
+    ("favorite, thumbnail url", FavoriteCreateDeleteView, FavoriteSerializer),
+    (
+        "cart, inline base64",
+        ShoppingCartCreateDeleteView,
+        Base64ShoppingCartSerializer,
+    ),
+    (
+        "cart, thumbnail url",
+        ShoppingCartCreateDeleteView,
+        ShoppingCartSerializer,
+    ),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures response size and latency of favorite and cart toggles "
+        "with images inlined as base64 and linked as thumbnail URLs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument(
+            "--image-size",
+            type=int,
+            default=1600,
+            help="Side of the uploaded square image in pixels.",
+        )
+
+    def handle(self, *args, **options):
+        buffer = BytesIO()
+        size = options["image_size"]
+        Image.effect_noise((size, size), 64).convert("RGB").save(
+            buffer, "JPEG", quality=90
+        )
+        source = image_storage.save(
+            "recipes/images/bench.jpg", ContentFile(buffer.getvalue())
+        )
+        renditions = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create(
+                    username="bench-toggles", email="bench@foodgram.test"
+                )
+                recipe = Recipe.objects.create(
+                    author=user,
+                    name="bench",
+                    text="bench",
+                    cooking_time=1,
+                    image=source,
+                )
+                renditions = render_renditions(recipe.pk, source)
+                self.stdout.write(
+                    f"original image {len(buffer.getvalue()) / 1024:.0f} KiB"
+                )
+                for label, view, serializer in CASES:
+                    self.run(label, view, serializer, user, recipe, options)
+                transaction.set_rollback(True)
+        finally:
+            for name in {source, *(renditions or {}).values()}:
+                image_storage.delete(name)
+
+    def run(self, label, view, serializer, user, recipe, options):
+        view = view.as_view(serializer_class=serializer)
+        factory = APIRequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        url = f"/api/recipes/{recipe.id}/"
+        sizes = []
+        started = time.perf_counter()
+        for _ in range(options["repeat"]):
+            for method in (factory.get, factory.delete):
+                request = method(url)
+                force_authenticate(request, user)
+                response = view(request, id=recipe.id)
+                if response.data:
+                    sizes.append(len(JSONRenderer().render(response.data)))
+        elapsed = (time.perf_counter() - started) / options["repeat"]
+        self.stdout.write(
+            f"{label:>24}: {max(sizes)} bytes, "
+            f"{elapsed * 1000:.2f} ms per add + remove"
+        )
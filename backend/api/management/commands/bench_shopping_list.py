@@ -0,0 +1,41 @@
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from api.shopping_list import RENDERERS, get_font
+
+
+class Command(BaseCommand):
+    help = "Measures render time and memory of shopping list downloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        items = [
+            {
+                "name": f"ингредиент номер {number}",
+                "measurement_unit": "г",
+                "amount": number,
+            }
+            for number in range(options["lines"])
+        ]
+        get_font()
+        for file_type, (render, _) in RENDERERS.items():
+            tracemalloc.start()
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                size = sum(len(chunk) for chunk in render(iter(items)))
+            elapsed = (time.perf_counter() - started) / options["repeat"]
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(
+                f"{file_type}: {options['lines']} lines, {size} bytes, "
+                f"{elapsed * 1000:.1f} ms, peak python heap "
+                f"{peak / 1024:.0f} KiB"
+            )
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(f"peak process RSS {rss / 1024:.1f} MiB")
@@ -0,0 +1,280 @@
+import base64
+import json
+import platform
+import random
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+SCENARIOS = (
+    "recipe_list",
+    "recipe_list_filtered",
+    "subscriptions",
+    "shopping_list_download",
+    "ingredient_autocomplete",
+    "recipe_create",
+)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[round(share * (len(ordered) - 1))]
+
+
+def read_body(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drives the main API endpoints through the test client against "
+        "the current database, e.g. one filled by seed_data, and reports "
+        "latency percentiles, query counts and memory as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=SCENARIOS,
+            help="Run only these scenarios, may be repeated.",
+        )
+        parser.add_argument(
+            "--username",
+            help="User to authenticate as, by default the most active one.",
+        )
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the cache before every request.",
+        )
+        parser.add_argument("--output", help="Write the results to a file.")
+        parser.add_argument(
+            "--baseline", help="Results of an earlier run to compare with."
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.user = self.get_user(options["username"])
+        self.client = APIClient(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.tags = list(
+            Tag.objects.order_by("id").values_list("slug", flat=True)
+        )
+        self.tag_ids = list(
+            Tag.objects.filter(slug__in=self.tags[:2]).values_list(
+                "id", flat=True
+            )
+        )
+        self.authors = list(
+            Recipe.objects.values_list("author_id", flat=True)
+            .distinct()
+            .order_by("author_id")[:100]
+        )
+        names = list(
+            Ingredient.objects.order_by("id").values_list("name", flat=True)
+        )
+        self.names = self.rng.sample(names, min(500, len(names)))
+        self.ingredients = list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)[
+                :200
+            ]
+        )
+        if not (self.tags and self.names):
+            raise CommandError("The database is empty, run seed_data first.")
+        results = {}
+        for name in options["scenario"] or SCENARIOS:
+            results[name] = self.run(name, options)
+            self.report(name, results[name])
+        document = {
+            "meta": self.describe(options),
+            "scenarios": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(document, file, ensure_ascii=False, indent=2)
+        if options["baseline"]:
+            self.compare(results, options["baseline"])
+
+    def get_user(self, username):
+        if username:
+            return User.objects.get(username=username)
+        user = (
+            User.objects.annotate(carts=Count("shoppingcart"))
+            .order_by("-carts", "id")
+            .first()
+        )
+        if user is None:
+            raise CommandError("There are no users, run seed_data first.")
+        return user
+
+    def describe(self, options):
+        return {
+            "started": datetime.now(timezone.utc).isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "user": self.user.username,
+            "recipes": Recipe.objects.count(),
+            "requests": options["requests"],
+            "warmup": options["warmup"],
+            "seed": options["seed"],
+            "cold": options["cold"],
+            "max_rss_mib": round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            ),
+        }
+
+    def recipe_list(self):
+        page = self.rng.choice((1, 1, 1, 2, 3))
+        return "get", "/api/recipes/", {"page": page, "limit": 6}
+
+    def recipe_list_filtered(self):
+        params = {"tags": self.rng.sample(self.tags, min(2, len(self.tags)))}
+        kind = self.rng.randrange(3)
+        if kind == 0 and self.authors:
+            params["author"] = self.rng.choice(self.authors)
+        elif kind == 1:
+            params["is_favorited"] = 1
+        else:
+            params["is_in_shopping_cart"] = 1
+        return "get", "/api/recipes/", params
+
+    def subscriptions(self):
+        return "get", "/api/users/subscriptions/", {"recipes_limit": 3}
+
+    def shopping_list_download(self):
+        return (
+            "get",
+            "/api/recipes/download_shopping_cart/",
+            {"type": self.rng.choice(("txt", "pdf"))},
+        )
+
+    def ingredient_autocomplete(self):
+        name = self.rng.choice(self.names)
+        return "get", "/api/ingredients/", {"name": name[: len(name) // 2]}
+
+    def recipe_create(self):
+        buffer = BytesIO()
+        Image.new("RGB", (64, 64), self.rng.choice(("red", "green"))).save(
+            buffer, "PNG"
+        )
+        image = base64.b64encode(buffer.getvalue()).decode()
+        ingredients = self.rng.sample(
+            self.ingredients, min(8, len(self.ingredients))
+        )
+        return (
+            "post",
+            "/api/recipes/",
+            {
+                "name": "benchmark",
+                "text": "benchmark",
+                "cooking_time": 10,
+                "tags": self.tag_ids,
+                "image": f"data:image/png;base64,{image}",
+                "ingredients": [{"id": pk, "amount": 1} for pk in ingredients],
+            },
+        )
+
+    def request(self, scenario, options, trace=False):
+        method, path, data = getattr(self, scenario)()
+        if options["cold"]:
+            cache.clear()
+        extra = {"format": "json"} if method == "post" else {}
+        if trace:
+            tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, data, **extra)
+            size = read_body(response)
+            elapsed = time.perf_counter() - started
+        peak = 0
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{scenario}: {method.upper()} {path} answered "
+                f"{response.status_code}: {response.content[:200]!r}"
+            )
+        return elapsed, len(queries), size, peak
+
+    def run(self, scenario, options):
+        # Writes are rolled back and uploads go to a scratch directory so
+        # that repeated runs see the same data.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ), transaction.atomic():
+            for _ in range(options["warmup"]):
+                self.request(scenario, options)
+            samples = [
+                self.request(scenario, options)
+                for _ in range(options["requests"])
+            ]
+            peak = self.request(scenario, options, trace=True)[3]
+            transaction.set_rollback(True)
+        latencies = [sample[0] * 1000 for sample in samples]
+        queries = [sample[1] for sample in samples]
+        return {
+            "requests": len(samples),
+            "p50_ms": round(percentile(latencies, 0.5), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "mean_ms": round(statistics.mean(latencies), 3),
+            "max_ms": round(max(latencies), 3),
+            "queries_median": statistics.median(queries),
+            "queries_max": max(queries),
+            "response_bytes": round(
+                statistics.mean(sample[2] for sample in samples)
+            ),
+            "peak_heap_kib": round(peak / 1024),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:>24}: p50 {result['p50_ms']:8.2f} ms, p95 "
+            f"{result['p95_ms']:8.2f} ms, {result['queries_median']:g} "
+            f"queries, {result['response_bytes']} bytes, peak heap "
+            f"{result['peak_heap_kib']} KiB"
+        )
+
+    def compare(self, results, path):
+        with open(path, encoding="utf-8") as file:
+            baseline = json.load(file)["scenarios"]
+        self.stdout.write(f"compared with {path}:")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            changes = []
+            for key in ("p50_ms", "p95_ms", "queries_median"):
+                before, after = baseline[name][key], result[key]
+                if before:
+                    changes.append(f"{key} {(after / before - 1) * 100:+.0f}%")
+                else:
+                    changes.append(f"{key} {before} -> {after}")
+            self.stdout.write(f"{name:>24}: {', '.join(changes)}")
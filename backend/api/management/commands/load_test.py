@@ -0,0 +1,116 @@
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient, Recipe, Tag
+
+from .benchmark import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends concurrent requests to the read-heavy endpoints of a running "
+        "server, e.g. started with SERVER_MODE=wsgi and then asgi, and "
+        "reports throughput and latency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--token", help="Authenticate the requests with this token."
+        )
+        parser.add_argument("--output", help="Write the results to a file.")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options["url"])
+        self.host, self.port = url.hostname, url.port or 80
+        self.headers = {"Accept": "application/json"}
+        if options["token"]:
+            self.headers["Authorization"] = f"Token {options['token']}"
+        rng = random.Random(options["seed"])
+        paths = self.get_paths(rng)
+        latencies, errors = [], []
+        deadline = time.monotonic() + options["duration"]
+        threads = [
+            threading.Thread(
+                target=self.worker,
+                args=(
+                    random.Random(rng.random()),
+                    paths,
+                    deadline,
+                    latencies,
+                    errors,
+                ),
+            )
+            for _ in range(options["concurrency"])
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        if not latencies:
+            raise CommandError(f"No request succeeded: {errors[:1]}")
+        result = {
+            "url": options["url"],
+            "concurrency": options["concurrency"],
+            "requests": len(latencies),
+            "errors": len(errors),
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        }
+        self.stdout.write(
+            f"{result['requests_per_second']} requests/s, p50 "
+            f"{result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+            f"{result['errors']} errors"
+        )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(result, file, indent=2)
+
+    def get_paths(self, rng):
+        tags = list(Tag.objects.values_list("slug", flat=True))
+        recipes = list(Recipe.objects.values_list("id", flat=True)[:1000])
+        names = list(Ingredient.objects.values_list("name", flat=True)[:500])
+        if not (tags and recipes and names):
+            raise CommandError("The database is empty, run seed_data first.")
+        paths = ["/api/tags/", "/api/recipes/"]
+        for _ in range(100):
+            query = urlencode({"tags": rng.sample(tags, 1), "page": 1}, True)
+            paths.append(f"/api/recipes/?{query}")
+            paths.append(f"/api/recipes/{rng.choice(recipes)}/")
+            name = rng.choice(names)
+            query = urlencode({"name": name[: len(name) // 2 or 1]})
+            paths.append(f"/api/ingredients/?{query}")
+        return paths
+
+    def worker(self, rng, paths, deadline, latencies, errors):
+        connection = http.client.HTTPConnection(self.host, self.port)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request(
+                    "GET", rng.choice(paths), headers=self.headers
+                )
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException) as error:
+                errors.append(repr(error))
+                connection.close()
+                connection = http.client.HTTPConnection(self.host, self.port)
+                continue
+            if response.status >= 400:
+                errors.append(response.status)
+            else:
+                latencies.append(time.perf_counter() - started)
+        connection.close()
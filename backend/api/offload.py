@@ -0,0 +1,128 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections, connections
+from django.urls import URLPattern
+
+from .connections import check_connections, mark_connections_used
+from .profiling import profile_queries
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_VIEW_THREADS,
+            thread_name_prefix="views",
+        )
+    return _executor
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    check_connections()
+    try:
+        with profile_queries():
+            response = view(request, *args, **kwargs)
+            if not response.streaming and hasattr(response, "render"):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+        mark_connections_used()
+
+
+def offload(view):
+    """
+    Async view running the sync ``view`` in a dedicated thread pool.
+
+    Under ASGI Django runs sync views one at a time in a single thread per
+    process, and Django 3.2 has no async ORM, so the pool is what lets
+    one worker wait on several database round trips at once. Each pool
+    thread keeps its own connection, closed or reused according to
+    CONN_MAX_AGE like the connection of a WSGI worker.
+    """
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        call = partial(run_view, view, request, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            get_executor(), contextvars.copy_context().run, call
+        )
+
+    return async_view
+
+
+def offload_patterns(patterns):
+    return [
+        URLPattern(
+            pattern.pattern,
+            offload(pattern.callback),
+            pattern.default_args,
+            pattern.name,
+        )
+        for pattern in patterns
+    ]
+
+
+def close_stream(response):
+    response.close()
+    connections.close_all()
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    ASGI handler producing the chunks of streaming responses in a thread.
+
+    Django 3.2 iterates streaming content in the event loop, where the ORM
+    refuses to run. The chunks are produced one by one in a thread of the
+    response's own, so a download reading a cursor keeps its connection
+    and holds a single chunk in memory at a time.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (str(name).encode("ascii"), str(value).encode("latin1"))
+            for name, value in response.items()
+        ]
+        headers += [
+            (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            for cookie in response.cookies.values()
+        ]
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": headers,
+            }
+        )
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="stream"
+        )
+        parts = iter(response)
+        try:
+            while True:
+                part = await loop.run_in_executor(executor, next, parts, None)
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": True,
+                        }
+                    )
+            await send({"type": "http.response.body"})
+        finally:
+            await loop.run_in_executor(executor, close_stream, response)
+            executor.shutdown(wait=False)
@@ -1,5 +1,144 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that keeps COUNT(*) of a query in the cache for a while."""
+
+    @cached_property
+    def count(self):
+        timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+        query = getattr(self.object_list, "query", None)
+        if not timeout or query is None:
+            return super().count
+        key = "pagination-count:{}".format(
+            hashlib.md5(str(query).encode()).hexdigest()
+        )
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout)
+        return count
+
+
+class KeysetPagination(CursorPagination):
+    page_size_query_param = "limit"
+    ordering = "-id"
+
+
+class RankedCursorPagination(BasePagination):
+    """
+    Keyset pagination of search results ordered by (rank, id).
+
+    The view provides ``search(queryset, query, after, limit)`` returning
+    objects with a ``search_rank`` attribute; the cursor carries the rank
+    and id of the last object of the page.
+    """
+
+    search_query_param = "search"
+    cursor_query_param = "cursor"
+    page_size_query_param = "limit"
+    max_page_size = 100
+    invalid_cursor_message = CursorPagination.invalid_cursor_message
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        query = request.query_params[self.search_query_param]
+        page = view.search(
+            queryset, query, self.decode_cursor(request), self.page_size + 1
+        )
+        self.has_next = len(page) > self.page_size
+        page = page[: self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK["PAGE_SIZE"]
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = parse_qs(b64decode(encoded.encode()).decode())
+            return float(position["r"][0]), int(position["p"][0])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = urlencode(
+            {"r": repr(self.last.search_rank), "p": self.last.pk}
+        )
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            b64encode(position.encode()).decode(),
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict([("next", self.get_next_link()), ("results", data)])
+        )
 
 
 class CustomPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination with opt-in keyset modes.
+
+    Requests carrying a ``cursor`` parameter (even an empty one) are
+    paginated by ``id`` without COUNT(*) and OFFSET, so every page costs
+    the same no matter how deep it is. A non-empty ``search`` parameter on
+    a view that implements ``search`` switches to ranked search results.
+    Plain lists, e.g. precomputed rankings, are always paginated by page
+    number.
+    """
+
     page_size_query_param = "limit"
+    django_paginator_class = CachedCountPaginator
+    delegate = None
+
+    def get_delegate(self, queryset, request, view):
+        if not isinstance(queryset, QuerySet):
+            return None
+        search = request.query_params.get(
+            RankedCursorPagination.search_query_param, ""
+        )
+        if search.strip() and hasattr(view, "search"):
+            return RankedCursorPagination()
+        if KeysetPagination.cursor_query_param in request.query_params:
+            return KeysetPagination()
+        return None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.delegate = self.get_delegate(queryset, request, view)
+        if self.delegate is not None:
+            return self.delegate.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.delegate is not None:
+            return self.delegate.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from rest_framework import renderers, serializers
+
+logger = logging.getLogger(__name__)
+
+_profile = ContextVar("request_profile", default=None)
+
+METRICS = (
+    ("requests", "counter", "Requests handled."),
+    ("db_queries", "counter", "SQL queries executed."),
+    ("db_seconds", "counter", "Time spent executing SQL queries."),
+    ("serializer_seconds", "counter", "Time spent serializing data."),
+    ("request_seconds", "counter", "Time spent handling requests."),
+    ("response_bytes", "counter", "Size of response bodies."),
+    ("max_db_queries", "gauge", "Most SQL queries of a single request."),
+    ("budget_violations", "counter", "Requests over the query budget."),
+)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestProfile:
+    """Numbers collected while handling one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+class ViewMetrics:
+    """Per-process totals of request profiles keyed by view and method."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, key, profile, elapsed, size, over_budget):
+        with self._lock:
+            stats = self._views.setdefault(
+                key, {name: 0 for name, _, _ in METRICS}
+            )
+            stats["requests"] += 1
+            stats["db_queries"] += profile.queries
+            stats["db_seconds"] += profile.db_time
+            stats["serializer_seconds"] += profile.serializer_time
+            stats["request_seconds"] += elapsed
+            stats["response_bytes"] += size
+            stats["max_db_queries"] = max(
+                stats["max_db_queries"], profile.queries
+            )
+            stats["budget_violations"] += over_budget
+
+    def snapshot(self):
+        with self._lock:
+            views = {
+                f"{method} {view}": dict(stats)
+                for (view, method), stats in sorted(self._views.items())
+            }
+        return {"worker": os.getpid(), "views": views}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_metrics = ViewMetrics()
+
+
+def timed_data(data):
+    """Wrap a serializer ``data`` property to time top-level serialization."""
+    getter = data.fget
+
+    @wraps(getter)
+    def timed(self):
+        profile = _profile.get()
+        if profile is None or profile.serializing:
+            return getter(self)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return getter(self)
+        finally:
+            profile.serializing = False
+            profile.serializer_time += time.perf_counter() - started
+
+    timed.profiled = True
+    return property(timed)
+
+
+def instrument_serializers():
+    for serializer in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(serializer.data.fget, "profiled", False):
+            serializer.data = timed_data(serializer.data)
+
+
+@contextmanager
+def profile_queries():
+    """Count queries of this thread's connection into the request profile."""
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    with connection.execute_wrapper(profile):
+        yield
+
+
+def get_query_budget(resolver_match, method):
+    """
+    Budget declared by the view in ``query_budgets``, keyed by viewset
+    action or by lower case HTTP method for plain API views. Budgets
+    include the token lookup, so tests forcing authentication stay one
+    query below them.
+    """
+    view = getattr(resolver_match.func, "cls", None)
+    budgets = getattr(view, "query_budgets", None)
+    if not budgets:
+        return None
+    actions = getattr(resolver_match.func, "actions", None) or {}
+    return budgets.get(actions.get(method.lower(), method.lower()))
+
+
+class ProfilingMiddleware:
+    """
+    Records query count, DB time, serializer time and response size of
+    every resolved view, and checks them against declared query budgets.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Lets Django call the middleware without a thread hop.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        if settings.PROFILING_ENABLED:
+            instrument_serializers()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.PROFILING_ENABLED:
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            with profile_queries():
+                response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.record(request, response, profile, started)
+
+    async def __acall__(self, request):
+        if not settings.PROFILING_ENABLED:
+            return await self.get_response(request)
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        started = time.perf_counter()
+        try:
+            # Queries run in worker threads, which copy the profile
+            # context and count into it themselves.
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.record(request, response, profile, started)
+
+    def record(self, request, response, profile, started):
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        if match is None:
+            return response
+        budget = get_query_budget(match, request.method)
+        over_budget = budget is not None and profile.queries > budget
+        size = 0 if response.streaming else len(response.content)
+        view_metrics.record(
+            (match.view_name, request.method),
+            profile,
+            elapsed,
+            size,
+            over_budget,
+        )
+        if over_budget:
+            message = (
+                f"{request.method} {match.view_name} ran {profile.queries} "
+                f"queries, the budget is {budget}"
+            )
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class PrometheusRenderer(renderers.BaseRenderer):
+    media_type = "text/plain"
+    format = "prometheus"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        lines = []
+        for name, kind, description in METRICS:
+            metric = f"foodgram_{name}"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for key, stats in data["views"].items():
+                method, view = key.split(" ", 1)
+                lines.append(
+                    f'{metric}{{view="{view}",method="{method}",'
+                    f'worker="{data["worker"]}"}} {stats[name]}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+class QueryBudgetTestRunner(DiscoverRunner):
+    """Test runner failing every request that exceeds its query budget."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.budgets = override_settings(
+            PROFILING_ENABLED=True, QUERY_BUDGET_STRICT=True
+        )
+        self.budgets.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.budgets.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,8 +1,9 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core import exceptions
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.db.models import fields
-from django.shortcuts import get_object_or_404
 from djoser.serializers import (
     UserCreateSerializer as DjoserRegistrationSerializer,
 )
@@ -12,6 +13,7 @@ from rest_framework import serializers, validators
 from rest_framework.serializers import ReadOnlyField
 from rest_framework.validators import UniqueTogetherValidator
 
+from recipes.images import get_rendition_names
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -20,6 +22,8 @@ from recipes.models import (
     ShoppingCart,
     Tag,
 )
+from recipes.services import shift_shopping_lists
+from recipes.storage import image_storage
 from users.models import Follow
 
 User = get_user_model()
@@ -53,29 +57,40 @@ class UserSerializer(DjoserUserSerializer):
             "password",
         )
 
-    def get_is_subscribed(self, user):
-        author = self.context["request"].user
-        if author.is_anonymous:
+    def get_is_subscribed(self, author):
+        if hasattr(author, "is_subscribed"):
+            return author.is_subscribed
+        user = self.context["request"].user
+        if user.is_anonymous:
             return False
         return Follow.objects.filter(user=user, author=author).exists()
 
 
+def get_image_urls(recipe, request=None):
+    urls = {}
+    for name, path in get_rendition_names(recipe).items():
+        url = image_storage.url(path)
+        urls[name] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+def get_thumbnail_url(recipe, request=None):
+    return get_image_urls(recipe, request).get("thumbnail")
+
+
 class ShowAuthorRecipeSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField(
-        max_length=None,
-        required=True,
-        allow_empty_file=False,
-        use_url=True,
-    )
+    image = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ("id", "name", "image", "cooking_time")
 
+    def get_image(self, obj):
+        return get_thumbnail_url(obj, self.context.get("request"))
 
-class SubscribesSerializer(DjoserUserSerializer):
 
-    is_subscribed = serializers.SerializerMethodField()
+class SubscribesSerializer(UserSerializer):
+
     recipes = serializers.SerializerMethodField("get_author_recipes")
     recipes_count = serializers.SerializerMethodField()
 
@@ -93,34 +108,14 @@ class SubscribesSerializer(DjoserUserSerializer):
         )
 
     def get_author_recipes(self, obj):
-        recipes_limit = self.context.get("request").GET.get(
-            "recipes_limit", None
-        )
-        if not recipes_limit is None:
-            recipes = Recipe.objects.filter(author=obj)[: int(recipes_limit)]
-            serializer = ShowAuthorRecipeSerializer(
-                data=recipes,
-                many=True,
-            )
-            serializer.is_valid()
-            return serializer.data
-        recipes = Recipe.objects.filter(author=obj)
-        serializer = ShowAuthorRecipeSerializer(
-            data=recipes,
-            many=True,
-        )
-        serializer.is_valid()
-        return serializer.data
-
-    def get_is_subscribed(self, user):
-        author = self.context["request"].user
-        if author.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=author).exists()
+        return ShowAuthorRecipeSerializer(
+            obj.recipe_set.all(), many=True, context=self.context
+        ).data
 
-    def get_recipes_count(self, user):
-        recipes = Recipe.objects.all().filter(author=user)
-        return len(recipes)
+    def get_recipes_count(self, obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
+        return obj.recipe_set.count()
 
 
 class FollowSerializer(UserSerializer):
@@ -176,6 +171,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -188,15 +185,30 @@ class RecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "images",
             "text",
             "cooking_time",
         )
 
+    def to_representation(self, instance):
+        if instance.author and hasattr(instance, "is_author_subscribed"):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
+    def get_image(self, obj):
+        rendition = self.context.get("image_rendition", "medium")
+        return self.get_images(obj).get(rendition)
+
+    def get_images(self, obj):
+        return get_image_urls(obj, self.context.get("request"))
+
     def get_ingredients(self, obj):
-        queryset = IngredientRecipe.objects.filter(recipe=obj)
+        queryset = obj.ingredientrecipe_set.all()
         return IngredientRecipeSerializer(queryset, many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         request = self.context.get("request")
         if request.user.is_anonymous:
             return False
@@ -204,6 +216,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         return Favorite.objects.filter(recipes=obj, user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         if request.user.is_anonymous:
             return False
@@ -211,6 +225,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         return ShoppingCart.objects.filter(recipe=obj, user=user).exists()
 
 
+class MatchedRecipeSerializer(RecipeSerializer):
+
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ("coverage", "missing")
+
+
+class RecipeMatchingSerializer(serializers.Serializer):
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
 class CreateRecipeSerializer(serializers.ModelSerializer):
 
     tags = serializers.PrimaryKeyRelatedField(
@@ -223,54 +254,105 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = "__all__"
 
-    def create(self, validated_data):
+    def validate_image(self, image):
+        width, height = image.image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                "Изображение слишком большое: {}x{}.".format(width, height)
+            )
+        return image
 
+    def validate_ingredients(self, ingredients):
+        amounts = {}
+        for ingredient in ingredients:
+            if ingredient["id"] in amounts:
+                raise serializers.ValidationError(
+                    "Ингредиенты не должны повторяться."
+                )
+            amounts[ingredient["id"]] = ingredient["amount"]
+        existing = set(
+            Ingredient.objects.filter(id__in=amounts).values_list(
+                "id", flat=True
+            )
+        )
+        missing = amounts.keys() - existing
+        if missing:
+            raise serializers.ValidationError(
+                "Ингредиенты не найдены: {}.".format(
+                    ", ".join(map(str, sorted(missing)))
+                )
+            )
+        return amounts
+
+    def set_ingredients(self, recipe, amounts):
+        current = {
+            row.ingredient_id: row for row in recipe.ingredientrecipe_set.all()
+        }
+        removed = current.keys() - amounts.keys()
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            row = current.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        added = [
+            IngredientRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if not (removed or changed or added):
+            return
+        shift_shopping_lists(recipe.id, -1)
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ["amount"])
+        IngredientRecipe.objects.bulk_create(added)
+        shift_shopping_lists(recipe.id, 1)
+
+    @transaction.atomic
+    def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
         recipe = Recipe.objects.create(**validated_data)
-        recipe.save()
         recipe.tags.set(tags)
-
-        for ingredient in ingredients:
-            IngredientRecipe.objects.create(
-                recipe=recipe,
-                ingredient=get_object_or_404(Ingredient, id=ingredient["id"]),
-                amount=ingredient["amount"],
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
+            for ingredient_id, amount in ingredients.items()
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-
-        ingredients = validated_data.pop("ingredients")
-        IngredientRecipe.objects.filter(recipe=instance).delete()
-        tags = validated_data.pop("tags")
-
-        for ingredient in ingredients:
-            IngredientRecipe.objects.create(
-                ingredient=get_object_or_404(Ingredient, id=ingredient["id"]),
-                recipe=instance,
-                amount=ingredient["amount"],
-            )
-
-        instance.name = validated_data.pop("name")
-        instance.text = validated_data.pop("text")
-        instance.image = validated_data.get('image', instance.image)
-        instance.cooking_time = validated_data.pop("cooking_time")
-        instance.tags.set(tags)
+        ingredients = validated_data.pop("ingredients", None)
+        tags = validated_data.pop("tags", None)
+        if ingredients is not None:
+            self.set_ingredients(instance, ingredients)
+        if tags is not None:
+            instance.tags.set(tags)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
-        data = RecipeSerializer(
-            instance, context={"request": self.context["request"]}
-        ).data
-        return data
+        request = self.context["request"]
+        instance = (
+            Recipe.objects.with_relations()
+            .with_user_flags(request.user)
+            .get(pk=instance.pk)
+        )
+        return RecipeSerializer(instance, context={"request": request}).data
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
 
     name = ReadOnlyField(source="recipes.name")
     cooking_time = ReadOnlyField(source="recipes.cooking_time")
-    image = Base64ImageField(read_only=True, source="recipes.image")
+    image = serializers.SerializerMethodField()
 
     class Meta:
         model = Favorite
@@ -281,12 +363,15 @@ class FavoriteSerializer(serializers.ModelSerializer):
             "image",
         )
 
+    def get_image(self, obj):
+        return get_thumbnail_url(obj.recipes, self.context.get("request"))
+
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
 
     name = ReadOnlyField(source="recipe.name")
     cooking_time = ReadOnlyField(source="recipe.cooking_time")
-    image = Base64ImageField(read_only=True, source="recipe.image")
+    image = serializers.SerializerMethodField()
 
     class Meta:
         model = ShoppingCart
@@ -296,3 +381,6 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             "cooking_time",
             "image",
         )
+
+    def get_image(self, obj):
+        return get_thumbnail_url(obj.recipe, self.context.get("request"))
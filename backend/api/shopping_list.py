@@ -0,0 +1,89 @@
+import csv
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FONT_NAME = "ShoppingListFont"
+FALLBACK_FONT = "Helvetica"
+CHUNK_SIZE = 64 * 1024
+MARGIN = 50
+LINE_HEIGHT = 18
+
+
+@lru_cache(maxsize=None)
+def get_font():
+    """Parse and register the Cyrillic font once per process."""
+    try:
+        pdfmetrics.registerFont(TTFont(FONT_NAME, settings.SHOPPING_LIST_FONT))
+    except (OSError, TypeError):
+        return FALLBACK_FONT
+    return FONT_NAME
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def render_text(items):
+    for item in items:
+        yield (
+            f'{item["name"]} - {item["amount"]}{item["measurement_unit"]}\n'
+        ).encode()
+    yield "\nFoodGram, 2021".encode()
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(("name", "measurement_unit", "amount")).encode()
+    for item in items:
+        yield writer.writerow(
+            (item["name"], item["measurement_unit"], item["amount"])
+        ).encode()
+
+
+def render_pdf(items):
+    """
+    Render the list into a spooled file and stream it back in chunks.
+
+    The file moves to disk once it outgrows CHUNK_SIZE, so the response
+    body is never held in memory as a single string.
+    """
+    font = get_font()
+    width, height = A4
+    with SpooledTemporaryFile(max_size=CHUNK_SIZE) as file:
+        pdf = canvas.Canvas(file, pagesize=A4, pageCompression=1)
+        pdf.setTitle("Список покупок")
+        pdf.setFont(font, 16)
+        top = height - MARGIN
+        pdf.drawString(MARGIN, top, "Список покупок")
+        position = top - LINE_HEIGHT * 2
+        pdf.setFont(font, 12)
+        for item in items:
+            if position < MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, 12)
+                position = top
+            pdf.drawString(
+                MARGIN,
+                position,
+                "• {} ({}) — {}".format(
+                    item["name"], item["measurement_unit"], item["amount"]
+                ),
+            )
+            position -= LINE_HEIGHT
+        pdf.save()
+        file.seek(0)
+        yield from iter(lambda: file.read(CHUNK_SIZE), b"")
+
+
+RENDERERS = {
+    "pdf": (render_pdf, "application/pdf"),
+    "csv": (render_csv, "text/csv; charset=utf-8"),
+    "txt": (render_text, "text/plain; charset=utf-8"),
+}
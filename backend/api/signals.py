@@ -0,0 +1,110 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.images import renditions_ready
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from users.models import Follow
+
+from .authentication import token_cache
+from .cache import (
+    recipe_lists_version,
+    recipe_relations_version,
+    recipe_version,
+    tags_version,
+    user_overlay_version,
+)
+
+User = get_user_model()
+
+
+def bump_on_commit(*versions):
+    for version in versions:
+        transaction.on_commit(version.bump)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    bump_on_commit(tags_version)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    bump_on_commit(recipe_version(instance.pk), recipe_lists_version)
+
+
+@receiver(renditions_ready, sender=Recipe)
+def invalidate_recipe_image(sender, recipe_id, **kwargs):
+    bump_on_commit(recipe_version(recipe_id), recipe_lists_version)
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def invalidate_recipe_ingredients(sender, instance, **kwargs):
+    bump_on_commit(recipe_version(instance.recipe_id), recipe_lists_version)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(sender, instance, action, reverse, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        bump_on_commit(recipe_relations_version, recipe_lists_version)
+    else:
+        bump_on_commit(recipe_version(instance.pk), recipe_lists_version)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_recipe_relations(sender, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    bump_on_commit(recipe_relations_version, recipe_lists_version)
+
+
+# Delete receivers would turn off fast deletes of these rows, the views
+# removing them bump the overlay instead.
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+def invalidate_user_overlay(sender, instance, **kwargs):
+    bump_on_commit(user_overlay_version(instance.user_id))
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    transaction.on_commit(partial(token_cache.invalidate, instance.key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    # Deleted users lose their tokens through the cascade.
+    if created:
+        return
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    keys = list(
+        Token.objects.filter(user_id=instance.pk).values_list("key", flat=True)
+    )
+    if keys:
+        transaction.on_commit(partial(token_cache.invalidate, *keys))
@@ -1,3 +1,1275 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.urls import include, path
+from django.test import (
+    AsyncClient,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import CursorPagination
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import urls as api_urls
+from api.authentication import token_cache
+from api.cache import get_user_overlay
+from api.connections import check_connections
+from api.filters import get_tag_slugs
+from api.offload import StreamingASGIHandler, offload_patterns
+from api.profiling import (
+    ProfilingMiddleware,
+    QueryBudgetExceeded,
+    view_metrics,
+)
+from api.serializers import CreateRecipeSerializer
+from api.views import TagApiViewSet
+
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.matching import recipe_ingredient_index
+from recipes.search import recipe_search_index
+from recipes.services import rebuild_shopping_lists
+from users.models import Follow
+
+User = get_user_model()
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username,
+        email=f"{username}@foodgram.test",
+        password="password",
+        first_name=username,
+        last_name=username,
+    )
+
+
+def create_recipes(author, count, ingredients, amount=1):
+    recipes = [
+        Recipe.objects.create(
+            author=author,
+            name=f"Рецепт {number}",
+            text="Описание",
+            cooking_time=10,
+        )
+        for number in range(count)
+    ]
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=amount)
+        for recipe in recipes
+        for ingredient in ingredients
+    )
+    return recipes
+
+
+class ShoppingListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("cook")
+        cls.salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        cls.salt_spoons = Ingredient.objects.create(
+            name="соль", measurement_unit="ст. л."
+        )
+        cls.milk = Ingredient.objects.create(
+            name="молоко", measurement_unit="мл"
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, count):
+        recipes = create_recipes(
+            self.user, count, (self.salt, self.salt_spoons, self.milk), 5
+        )
+        for recipe in recipes:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def test_amounts_are_merged_per_name_and_unit(self):
+        self.fill_cart(3)
+        response = self.client.get("/api/recipes/shopping_list/")
+        self.assertEqual(
+            response.json(),
+            [
+                {"name": "молоко", "measurement_unit": "мл", "amount": 15},
+                {"name": "соль", "measurement_unit": "г", "amount": 15},
+                {"name": "соль", "measurement_unit": "ст. л.", "amount": 15},
+            ],
+        )
+
+    def download(self, file_type):
+        response = self.client.get(
+            f"/api/recipes/download_shopping_cart/?type={file_type}"
+        )
+        return response, b"".join(response.streaming_content)
+
+    def test_download_contains_every_line(self):
+        self.fill_cart(2)
+        content = self.download("txt")[1].decode()
+        self.assertIn("молоко - 10мл", content)
+        self.assertIn("соль - 10г", content)
+        self.assertIn("соль - 10ст. л.", content)
+        self.assertTrue(content.endswith("\n\nFoodGram, 2021"))
+        self.assertIn("соль,ст. л.,10", self.download("csv")[1].decode())
+
+    def test_download_pdf(self):
+        self.fill_cart(2)
+        response, content = self.download("pdf")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(content.startswith(b"%PDF"))
+        response = self.client.get(
+            "/api/recipes/download_shopping_cart/?type=docx"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_incremental_totals_match_rebuild(self):
+        self.fill_cart(3)
+        first, second, third = Recipe.objects.order_by("id")
+        CreateRecipeSerializer().set_ingredients(
+            first, {self.salt.id: 1, self.milk.id: 5}
+        )
+        self.client.delete(f"/api/recipes/{second.id}/shopping_cart/")
+        third.delete()
+        response = self.client.get("/api/recipes/shopping_list/")
+        self.assertEqual(
+            response.json(),
+            [
+                {"amount": 5, "name": "молоко", "measurement_unit": "мл"},
+                {"amount": 1, "name": "соль", "measurement_unit": "г"},
+            ],
+        )
+        call_command("rebuild_shopping_lists", "--check", stdout=StringIO())
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for count in (1, 50):
+            with self.subTest(cart_size=count):
+                ShoppingCart.objects.all().delete()
+                self.fill_cart(count)
+                with self.assertNumQueries(1):
+                    self.download("pdf")
+                with self.assertNumQueries(1):
+                    self.client.get("/api/recipes/shopping_list/")
+
+    def test_cascades_update_lists_once(self):
+        queries = []
+        for count in (1, 50):
+            recipe, other = create_recipes(self.user, 2, (self.salt,))
+            User.objects.bulk_create(
+                User(username=f"cook-{count}-{n}", email=f"{count}-{n}@x.y")
+                for n in range(count)
+            )
+            users = User.objects.filter(username__startswith=f"cook-{count}-")
+            ShoppingCart.objects.bulk_create(
+                ShoppingCart(user=user, recipe=cart_recipe)
+                for user in users
+                for cart_recipe in (recipe, other)
+            )
+            rebuild_shopping_lists()
+            with CaptureQueriesContext(connection) as captured:
+                recipe.delete()
+            queries.append(len(captured))
+        self.assertEqual(queries[0], queries[1])
+        users[0].delete()
+        call_command("rebuild_shopping_lists", "--check", stdout=StringIO())
+
+
+class RecipeListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("reader")
+        cls.author = create_user("author")
+        Follow.objects.create(user=cls.user, author=cls.author)
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {number}", measurement_unit="г"
+            )
+            for number in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=f"тег {number}", slug=f"tag-{number}")
+            for number in range(2)
+        ]
+        cls.recipes = create_recipes(cls.author, 100, ingredients)
+        for recipe in cls.recipes:
+            recipe.tags.set(tags)
+        Favorite.objects.create(user=cls.user, recipes=cls.recipes[-1])
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[-1])
+
+    def setUp(self):
+        cache.clear()
+        caches["responses"].clear()
+        get_user_overlay(self.user)
+        get_tag_slugs()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_user_flags_are_annotated(self):
+        response = self.client.get("/api/recipes/?limit=2")
+        first, second = response.json()["results"]
+        self.assertTrue(first["is_favorited"])
+        self.assertTrue(first["is_in_shopping_cart"])
+        self.assertTrue(first["author"]["is_subscribed"])
+        self.assertFalse(second["is_favorited"])
+        self.assertFalse(second["is_in_shopping_cart"])
+        self.assertEqual(len(first["ingredients"]), 3)
+        self.assertEqual(len(first["tags"]), 2)
+
+    def test_shared_page_is_personalized_per_user(self):
+        self.client.get("/api/recipes/?limit=2")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/recipes/?limit=2")
+        self.assertEqual(response["X-Cache"], "HIT")
+        first = response.json()["results"][0]
+        self.assertTrue(first["is_favorited"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/api/recipes/{first['id']}/favorite/")
+        response = self.client.get("/api/recipes/?limit=2")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertFalse(response.json()["results"][0]["is_favorited"])
+        self.client.force_authenticate(self.author)
+        first = self.client.get("/api/recipes/?limit=2").json()["results"][0]
+        self.assertFalse(first["is_in_shopping_cart"])
+        self.assertFalse(first["author"]["is_subscribed"])
+
+    def test_query_budget_does_not_depend_on_page_size(self):
+        for limit in (6, 100):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(4):
+                    response = self.client.get(f"/api/recipes/?limit={limit}")
+                self.assertEqual(len(response.json()["results"]), limit)
+
+    def test_anonymous_query_budget(self):
+        self.client.force_authenticate(None)
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/recipes/?limit=100")
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/recipes/?limit=100")
+        self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_anonymous_cache_is_invalidated_by_changes(self):
+        self.client.force_authenticate(None)
+        recipe = self.recipes[-1]
+        url = f"/api/recipes/{recipe.id}/"
+        self.client.get(url)
+        self.client.get("/api/recipes/?limit=1")
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = "Новое название"
+            recipe.save()
+        self.assertEqual(self.client.get(url).json()["name"], recipe.name)
+        response = self.client.get("/api/recipes/?limit=1")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["results"][0]["name"], recipe.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = "Иван"
+            self.author.save()
+        response = self.client.get(url)
+        self.assertEqual(response.json()["author"]["first_name"], "Иван")
+
+    def test_cursor_mode_walks_all_recipes_without_count(self):
+        seen = []
+        url = "/api/recipes/?cursor=&limit=30"
+        while url:
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertNotIn("count", response.json())
+            seen.extend(recipe["id"] for recipe in response.json()["results"])
+            url = response.json()["next"]
+        self.assertEqual(seen, [recipe.id for recipe in self.recipes][::-1])
+
+
+class RecipeFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("reader")
+        cls.authors = [create_user("first"), create_user("second")]
+        cls.tags = [
+            Tag.objects.create(name=f"тег {number}", slug=f"tag-{number}")
+            for number in range(3)
+        ]
+        cls.recipes = []
+        for author in cls.authors:
+            for number, recipe in enumerate(create_recipes(author, 6, [])):
+                recipe.tags.set(cls.tags[: number % 3 + 1])
+                cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipes=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        caches["responses"].clear()
+        get_tag_slugs()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_ids(self, query):
+        response = self.client.get(f"/api/recipes/?limit=100&{query}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return [recipe["id"] for recipe in response.json()["results"]]
+
+    def expected(self, predicate):
+        return sorted(
+            (recipe.id for recipe in self.recipes if predicate(recipe)),
+            reverse=True,
+        )
+
+    def test_filters_compose(self):
+        author = self.authors[1]
+        favorites = set(Favorite.objects.values_list("recipes", flat=True))
+        cart = set(ShoppingCart.objects.values_list("recipe", flat=True))
+        tagged = set(
+            Recipe.objects.filter(
+                tags__slug__in=["tag-1", "tag-2"]
+            ).values_list("id", flat=True)
+        )
+        self.assertEqual(
+            self.get_ids(
+                f"tags=tag-1&tags=tag-2&author={author.id}&is_favorited=1"
+            ),
+            self.expected(
+                lambda recipe: recipe.author_id == author.id
+                and recipe.id in favorites
+                and recipe.id in tagged
+            ),
+        )
+        self.assertEqual(
+            self.get_ids("is_favorited=1&is_in_shopping_cart=1"),
+            self.expected(
+                lambda recipe: recipe.id in favorites and recipe.id in cart
+            ),
+        )
+
+    def test_tags_do_not_duplicate_rows(self):
+        response = self.client.get(
+            "/api/recipes/?limit=100&tags=tag-0&tags=tag-1&tags=tag-2"
+        )
+        ids = [recipe["id"] for recipe in response.json()["results"]]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(response.json()["count"], len(self.recipes))
+
+    def test_unknown_tag_is_rejected(self):
+        response = self.client.get("/api/recipes/?tags=missing")
+        self.assertEqual(response.status_code, 400)
+
+    def test_personal_filters_for_anonymous_user(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.get_ids("is_favorited=1"), [])
+        self.assertEqual(len(self.get_ids("is_favorited=0")), 12)
+
+    def test_combined_filters_run_in_one_query(self):
+        author = self.authors[0]
+        with self.assertNumQueries(4):
+            self.client.get(
+                f"/api/recipes/?tags=tag-0&author={author.id}"
+                "&is_favorited=1&is_in_shopping_cart=1"
+            )
+
+
+class RecipeSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        tomato = Ingredient.objects.create(name="томат", measurement_unit="г")
+        salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        cls.tag = Tag.objects.create(name="Обед", slug="lunch")
+        cls.soup, cls.salad, cls.pasta = [
+            Recipe.objects.create(
+                author=cls.author, name=name, text=text, cooking_time=10
+            )
+            for name, text in (
+                ("Томатный суп", "Суп на обед"),
+                ("Салат", "Свежий салат из томат и соль"),
+                ("Паста", "Паста с соусом"),
+            )
+        ]
+        IngredientRecipe.objects.bulk_create(
+            [
+                IngredientRecipe(
+                    recipe=cls.salad, ingredient=tomato, amount=1
+                ),
+                IngredientRecipe(
+                    recipe=cls.pasta, ingredient=tomato, amount=1
+                ),
+                IngredientRecipe(recipe=cls.pasta, ingredient=salt, amount=1),
+            ]
+        )
+        cls.pasta.tags.add(cls.tag)
+        cls.fillers = create_recipes(cls.author, 7, [tomato])
+
+    def setUp(self):
+        cache.clear()
+        caches["responses"].clear()
+        recipe_search_index.invalidate()
+        self.client = APIClient()
+
+    def search(self, query, **params):
+        response = self.client.get(
+            "/api/recipes/", {"search": query, **params}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_results_are_ranked_by_field_weight(self):
+        ids = [
+            recipe["id"] for recipe in self.search("соль", limit=10)["results"]
+        ]
+        self.assertEqual(ids, [self.pasta.id, self.salad.id])
+
+    def test_every_word_must_match(self):
+        results = self.search("томат соль")["results"]
+        self.assertEqual(
+            [recipe["id"] for recipe in results],
+            [self.pasta.id, self.salad.id],
+        )
+        self.assertEqual(self.search("томат суп")["results"], [])
+
+    def test_search_composes_with_filters(self):
+        results = self.search("томат", tags="lunch")["results"]
+        self.assertEqual([recipe["id"] for recipe in results], [self.pasta.id])
+
+    def test_keyset_pages_cover_all_matches(self):
+        response = self.search("томат", limit=3)
+        seen = [recipe["id"] for recipe in response["results"]]
+        while response["next"]:
+            response = self.client.get(response["next"]).json()
+            self.assertNotIn("count", response)
+            seen.extend(recipe["id"] for recipe in response["results"])
+        self.assertEqual(len(seen), 9)
+        self.assertEqual(len(set(seen)), 9)
+        self.assertEqual(seen[0], self.salad.id)
+
+    def test_changes_are_searchable_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup.name = "Гороховый суп"
+            self.soup.save()
+        self.assertEqual(self.search("Томатный")["results"], [])
+        results = self.search("гороховый")["results"]
+        self.assertEqual([recipe["id"] for recipe in results], [self.soup.id])
+
+    def test_cascades_refresh_search_once(self):
+        ingredients = [
+            Ingredient.objects.create(name=f"специя {n}", measurement_unit="г")
+            for n in range(5)
+        ]
+        recipe = create_recipes(self.author, 1, ingredients)[0]
+        with mock.patch.object(recipe_search_index, "invalidate") as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+        refresh.assert_called_once_with()
+
+    def test_recipe_pages_skip_search_vector(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/recipes/")
+            self.client.get(f"/api/recipes/{self.soup.id}/")
+        self.assertNotIn("search_vector", str(queries.captured_queries))
+
+    def test_tied_ranks_span_pages(self):
+        # The fillers only match by ingredient, so they all rank the same.
+        filler_ids = {filler.id for filler in self.fillers}
+        response = self.search("томат", limit=2)
+        seen = [recipe["id"] for recipe in response["results"]]
+        while response["next"]:
+            response = self.client.get(response["next"]).json()
+            seen.extend(recipe["id"] for recipe in response["results"])
+        self.assertEqual(
+            [pk for pk in seen if pk in filler_ids],
+            sorted(filler_ids, reverse=True),
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            "/api/recipes/", {"search": "томат", "cursor": "x"}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(
+            response.json()["detail"],
+            str(CursorPagination.invalid_cursor_message),
+        )
+        self.assertNotEqual(response.json()["detail"], "Invalid cursor")
+
+
+class RecipeMatchingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {number}", measurement_unit="г"
+            )
+            for number in range(3)
+        ]
+        cls.full = create_recipes(cls.author, 1, cls.ingredients[:1])[0]
+        cls.partial = create_recipes(cls.author, 1, cls.ingredients)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def match(self, **params):
+        return self.client.get("/api/recipes/matching/", params)
+
+    def test_recipes_are_ranked_by_coverage(self):
+        response = self.match(ingredients=[self.ingredients[0].id])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(
+            [(recipe["id"], recipe["missing"]) for recipe in results],
+            [(self.full.id, 0), (self.partial.id, 2)],
+        )
+        self.assertAlmostEqual(results[1]["coverage"], 1 / 3)
+        response = self.match(
+            ingredients=[self.ingredients[0].id], limit=1, page=2
+        )
+        self.assertEqual(response.json()["count"], 2)
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]],
+            [self.partial.id],
+        )
+        response = self.match(
+            ingredients=[self.ingredients[0].id], max_missing=1
+        )
+        self.assertEqual(response.json()["count"], 1)
+
+    def test_recipe_changes_are_picked_up(self):
+        self.match(ingredients=[self.ingredients[2].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.create(
+                recipe=self.full, ingredient=self.ingredients[2], amount=1
+            )
+        response = self.match(ingredients=[self.ingredients[2].id])
+        self.assertEqual(
+            [recipe["id"] for recipe in response.json()["results"]],
+            [self.full.id, self.partial.id],
+        )
+
+    def test_cascades_record_one_change(self):
+        recipe = create_recipes(self.author, 1, self.ingredients)[0]
+        pk, index = recipe.pk, recipe_ingredient_index
+        before = cache.get(index.sequence_key, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        sequence = cache.get(index.sequence_key)
+        self.assertEqual(sequence, before + 1)
+        self.assertIn(pk, cache.get(index.change_key.format(sequence)))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.match().status_code, 400)
+        response = self.match(ingredients=["x"], max_missing=-1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"ingredients", "max_missing"})
+
+    def test_keyset_parameters_fall_back_to_page_numbers(self):
+        for params in ({"cursor": ""}, {"search": "Рецепт"}):
+            with self.subTest(params=params):
+                response = self.match(
+                    ingredients=[self.ingredients[0].id], **params
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["count"], 2)
+
+
+class SubscriptionListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("follower")
+        for number, count in enumerate((3, 40, 0)):
+            author = create_user(f"author{number}")
+            create_recipes(author, count, ())
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_are_limited_per_author(self):
+        response = self.client.get("/api/users/subscriptions/?recipes_limit=2")
+        authors = response.json()["results"]
+        self.assertEqual(
+            [author["recipes_count"] for author in authors], [3, 40, 0]
+        )
+        self.assertEqual(
+            [len(author["recipes"]) for author in authors], [2, 2, 0]
+        )
+        self.assertTrue(all(author["is_subscribed"] for author in authors))
+
+    def test_only_recipes_of_the_page_are_read(self):
+        second = User.objects.get(username="author1")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/api/users/subscriptions/?recipes_limit=2&limit=1&page=2"
+            )
+        [author] = response.json()["results"]
+        self.assertEqual(author["id"], second.id)
+        self.assertEqual(
+            [recipe["id"] for recipe in author["recipes"]],
+            list(
+                second.recipe_set.order_by("-id").values_list("id", flat=True)
+            )[:2],
+        )
+        recipes = queries.captured_queries[-1]["sql"]
+        self.assertIn("ROW_NUMBER()", recipes)
+        self.assertIn(f"author_id IN ({second.id})", recipes)
+
+    def test_query_count_does_not_depend_on_recipe_count(self):
+        with self.assertNumQueries(3):
+            self.client.get("/api/users/subscriptions/?recipes_limit=3")
+        with self.assertNumQueries(3):
+            self.client.get("/api/users/subscriptions/")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("writer")
+        cls.tag = Tag.objects.create(name="Завтрак", slug="breakfast")
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f"ингредиент {number}", measurement_unit="г"
+            )
+            for number in range(40)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def payload(self, amounts):
+        return {
+            "name": "Омлет",
+            "text": "Взбить и пожарить.",
+            "cooking_time": 10,
+            "tags": [self.tag.id],
+            "image": IMAGE,
+            "ingredients": [
+                {"id": ingredient.id, "amount": amount}
+                for ingredient, amount in amounts
+            ],
+        }
+
+    def save(self, data, instance=None):
+        request = APIRequestFactory().post("/api/recipes/")
+        request.user = self.author
+        serializer = CreateRecipeSerializer(
+            instance, data=data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save(author=self.author)
+
+    def amounts(self, recipe):
+        return dict(
+            recipe.ingredientrecipe_set.values_list("ingredient_id", "amount")
+        )
+
+    def test_create_runs_a_fixed_number_of_statements(self):
+        data = self.payload((ingredient, 5) for ingredient in self.ingredients)
+        with self.assertNumQueries(9):
+            recipe = self.save(data)
+        self.assertEqual(len(self.amounts(recipe)), 40)
+
+    def test_update_touches_only_changed_rows(self):
+        recipe = self.save(
+            self.payload((ingredient, 5) for ingredient in self.ingredients)
+        )
+        kept = self.ingredients[:38]
+        data = self.payload(
+            [(kept[0], 7)] + [(ingredient, 5) for ingredient in kept[1:]]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.save(data, recipe)
+        writes = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith(
+                (
+                    'DELETE FROM "recipes_ingredientrecipe"',
+                    'UPDATE "recipes_ingredientrecipe"',
+                    'INSERT INTO "recipes_ingredientrecipe"',
+                )
+            )
+        ]
+        self.assertEqual(len(writes), 2)
+        amounts = self.amounts(recipe)
+        self.assertEqual(len(amounts), 38)
+        self.assertEqual(amounts[kept[0].id], 7)
+
+    def test_unknown_ingredient_leaves_no_recipe(self):
+        payload = self.payload([(self.ingredients[0], 1)])
+        response = self.client.post(
+            "/api/recipes/",
+            {**payload, "ingredients": [{"id": 0, "amount": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_failed_ingredient_insert_leaves_no_recipe(self):
+        payload = self.payload([(self.ingredients[0], 1)])
+        with mock.patch.object(
+            IngredientRecipe.objects,
+            "bulk_create",
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.post("/api/recipes/", payload, format="json")
+        self.assertFalse(Recipe.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_RENDITION_WORKERS=0)
+class RecipeImageTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("writer")
+        cls.tag = Tag.objects.create(name="Завтрак", slug="breakfast")
+        cls.ingredient = Ingredient.objects.create(
+            name="яйцо", measurement_unit="шт"
+        )
+
+    def setUp(self):
+        cache.clear()
+        caches["responses"].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def image(self, size, image_format="PNG"):
+        buffer = BytesIO()
+        Image.new("RGB", size, "orange").save(buffer, image_format)
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f"data:image/{image_format.lower()};base64,{encoded}"
+
+    def create(self, image, render=True):
+        with self.captureOnCommitCallbacks(execute=render):
+            return self.client.post(
+                "/api/recipes/",
+                {
+                    "name": "Омлет",
+                    "text": "Взбить и пожарить.",
+                    "cooking_time": 10,
+                    "tags": [self.tag.id],
+                    "image": image,
+                    "ingredients": [{"id": self.ingredient.id, "amount": 2}],
+                },
+                format="json",
+            )
+
+    def test_renditions_are_served_by_size(self):
+        response = self.create(self.image((2000, 1000)))
+        self.assertEqual(response.status_code, 201, response.content)
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            set(recipe.image_renditions),
+            {"source", "thumbnail", "thumbnail_webp", "medium", "medium_webp"},
+        )
+        with default_storage.open(recipe.image_renditions["thumbnail"]) as f:
+            self.assertEqual(Image.open(f).size, (320, 160))
+        with default_storage.open(recipe.image_renditions["medium_webp"]) as f:
+            self.assertEqual(Image.open(f).format, "WEBP")
+        card = self.client.get("/api/recipes/").json()["results"][0]
+        self.assertTrue(
+            card["image"].endswith(recipe.image_renditions["thumbnail"])
+        )
+        detail = self.client.get(f"/api/recipes/{recipe.id}/").json()
+        self.assertTrue(
+            detail["image"].endswith(recipe.image_renditions["medium"])
+        )
+        self.assertTrue(detail["images"]["thumbnail_webp"].endswith(".webp"))
+
+    def stored_images(self):
+        if not default_storage.exists("recipes/images"):
+            return set()
+        return set(default_storage.listdir("recipes/images")[1])
+
+    def test_same_upload_is_stored_and_rendered_once(self):
+        image = self.image((600, 400))
+        stored = self.stored_images()
+        self.create(image)
+        self.create(image)
+        first, second = Recipe.objects.all()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image_renditions, second.image_renditions)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f"/api/recipes/{first.id}/",
+                {"image": image, "name": "Омлет с сыром"},
+                format="json",
+            )
+        first.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(self.stored_images() - stored), 1)
+
+    def test_replaced_image_is_collected(self):
+        self.create(self.image((400, 400)))
+        recipe = Recipe.objects.get()
+        old = recipe.image_renditions
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/recipes/{recipe.id}/",
+                {"image": self.image((500, 500), "JPEG")},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        recipe.refresh_from_db()
+        self.assertNotEqual(recipe.image_renditions["source"], old["source"])
+        call_command("collect_images", grace=0, stdout=StringIO())
+        for name in set(old.values()) - set(recipe.image_renditions.values()):
+            self.assertFalse(default_storage.exists(name))
+        for name in recipe.image_renditions.values():
+            self.assertTrue(default_storage.exists(name))
+
+    def test_original_is_served_until_renditions_are_ready(self):
+        self.create(self.image((100, 100)), render=False)
+        recipe = Recipe.objects.get()
+        card = self.client.get("/api/recipes/").json()["results"][0]
+        self.assertTrue(card["image"].endswith(recipe.image.name))
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_oversized_image_is_rejected(self):
+        response = self.create(self.image((20, 20)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image", response.json())
+
+
+class RelationToggleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("clicker")
+        cls.author = create_user("chef")
+        (cls.recipe,) = create_recipes(cls.author, 1, ())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_toggles_are_idempotent_and_cheap(self):
+        # SELECT target, then INSERT wrapped in a savepoint; removal is a
+        # single DELETE. The cart row is selected for its delete signal,
+        # which updates the precomputed shopping list, and that list has
+        # nothing to prune here.
+        for url, model, add_queries, delete_queries in (
+            (f"/api/recipes/{self.recipe.id}/favorite/", Favorite, 4, 1),
+            (
+                f"/api/recipes/{self.recipe.id}/shopping_cart/",
+                ShoppingCart,
+                5,
+                3,
+            ),
+            (f"/api/users/{self.author.id}/subscribe/", Follow, 4, 1),
+        ):
+            with self.subTest(url=url):
+                with self.assertNumQueries(add_queries):
+                    self.client.get(url)
+                self.client.get(url)
+                self.assertEqual(model.objects.count(), 1)
+                with self.assertNumQueries(delete_queries):
+                    response = self.client.delete(url)
+                self.assertLess(response.status_code, 300)
+                response = self.client.delete(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertFalse(model.objects.exists())
+
+    def test_recipe_payload(self):
+        response = self.client.get(
+            f"/api/recipes/{self.recipe.id}/shopping_cart/"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["name"], self.recipe.name)
+
+    def test_payload_links_thumbnail_without_reading_the_image(self):
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image="recipes/images/dish.png",
+            image_renditions={
+                "source": "recipes/images/dish.png",
+                "thumbnail": "recipes/renditions/dish/thumbnail.jpg",
+            },
+        )
+        with mock.patch.object(
+            default_storage, "open", side_effect=AssertionError
+        ):
+            response = self.client.get(
+                f"/api/recipes/{self.recipe.id}/favorite/"
+            )
+        self.assertEqual(
+            response.json()["image"],
+            "http://testserver/media/recipes/renditions/dish/thumbnail.jpg",
+        )
+
+
+class TagCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name="Обед", slug="lunch")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_conditional_get_skips_database(self):
+        response = self.client.get("/api/tags/")
+        self.assertEqual(response.json()[0]["slug"], "lunch")
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/api/tags/{self.tag.id}/")
+        self.assertEqual(response.json()["name"], "Обед")
+
+    def test_tag_change_invalidates_catalog(self):
+        etag = self.client.get("/api/tags/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name="Ужин", slug="dinner")
+        response = self.client.get("/api/tags/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@foodgram.test", password="password"
+        )
+        cls.user = create_user("profiled")
+        Tag.objects.create(name="Обед", slug="lunch")
+
+    def setUp(self):
+        cache.clear()
+        view_metrics.reset()
+        self.client = APIClient()
+
+    def test_metrics_are_admin_only(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+
+    def test_views_are_measured(self):
+        self.client.get("/api/tags/")
+        self.client.get("/api/tags/")
+        self.client.force_authenticate(self.admin)
+        stats = self.client.get("/api/metrics/").json()["views"]
+        tags = stats["GET tags-list"]
+        self.assertEqual(tags["requests"], 2)
+        self.assertEqual(tags["db_queries"], 1)
+        self.assertEqual(tags["max_db_queries"], 1)
+        self.assertGreater(tags["serializer_seconds"], 0)
+        self.assertGreater(tags["response_bytes"], 0)
+        response = self.client.get("/api/metrics/", {"format": "prometheus"})
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(
+            'foodgram_requests{view="tags-list",method="GET",',
+            response.content.decode(),
+        )
+
+    def test_recipe_delete_fits_budget(self):
+        recipe = create_recipes(self.user, 1, [])[0]
+        self.client.force_authenticate(self.user)
+        with override_settings(QUERY_BUDGET_STRICT=True):
+            response = self.client.delete(f"/api/recipes/{recipe.id}/")
+        self.assertEqual(response.status_code, 204)
+
+    @mock.patch.object(
+        TagApiViewSet, "query_budgets", {"list": 0}, create=True
+    )
+    def test_exceeded_budget(self):
+        with override_settings(QUERY_BUDGET_STRICT=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/tags/")
+        cache.clear()
+        with override_settings(QUERY_BUDGET_STRICT=False):
+            with self.assertLogs("api.profiling", "WARNING"):
+                response = self.client.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        stats = view_metrics.snapshot()["views"]["GET tags-list"]
+        self.assertEqual(stats["budget_violations"], 2)
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_profiling_leaves_serializers_alone(self):
+        with mock.patch("api.profiling.instrument_serializers") as instrument:
+            ProfilingMiddleware(lambda request: None)
+        instrument.assert_not_called()
+        self.client.get("/api/tags/")
+        self.assertEqual(view_metrics.snapshot()["views"], {})
+
+
+class BenchmarkTests(TestCase):
+    def test_results_are_saved_as_json(self):
+        call_command(
+            "seed_data",
+            users=10,
+            recipes=20,
+            ingredients=30,
+            stdout=StringIO(),
+        )
+        output = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
+        output.close()
+        self.addCleanup(os.remove, output.name)
+        call_command(
+            "benchmark",
+            requests=3,
+            warmup=1,
+            output=output.name,
+            stdout=StringIO(),
+        )
+        with open(output.name, encoding="utf-8") as file:
+            results = json.load(file)
+        self.assertEqual(results["meta"]["recipes"], 20)
+        self.assertEqual(
+            set(results["scenarios"]),
+            {
+                "recipe_list",
+                "recipe_list_filtered",
+                "subscriptions",
+                "shopping_list_download",
+                "ingredient_autocomplete",
+                "recipe_create",
+            },
+        )
+        for result in results["scenarios"].values():
+            self.assertEqual(result["requests"], 3)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+        self.assertEqual(Recipe.objects.count(), 20)
+
+
+class OffloadedUrls:
+    urlpatterns = [
+        path("api/", include(offload_patterns(api_urls.urlpatterns)))
+    ]
+
+
+@override_settings(ROOT_URLCONF=OffloadedUrls)
+class OffloadedViewTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        view_metrics.reset()
+        self.user = create_user("async")
+        self.token = Token.objects.create(user=self.user)
+        self.tag = Tag.objects.create(name="Обед", slug="lunch")
+        salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        recipe = create_recipes(self.user, 1, [salt])[0]
+        recipe.tags.add(self.tag)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.client = AsyncClient()
+
+    def get(self, path, data):
+        # The async client of Django 3.2 drops query parameters.
+        return self.client.get(
+            f"{path}?{urlencode(data)}",
+            authorization=f"Token {self.token.key}",
+        )
+
+    async def test_reads_are_served_from_worker_threads(self):
+        response = await self.get("/api/recipes/", {"tags": "lunch"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["name"], "Рецепт 0")
+        response = await self.get("/api/ingredients/", {"name": "со"})
+        self.assertEqual(response.json()[0]["name"], "соль")
+        stats = view_metrics.snapshot()["views"]["GET recipes-list"]
+        self.assertGreater(stats["db_queries"], 0)
+
+    async def test_streaming_download_is_produced_in_a_thread(self):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request"}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/recipes/download_shopping_cart/",
+            "query_string": b"type=txt",
+            "headers": [
+                (b"host", b"testserver"),
+                (b"authorization", f"Token {self.token.key}".encode()),
+            ],
+        }
+        await StreamingASGIHandler()(scope, receive, send)
+        self.assertEqual(messages[0]["status"], 200)
+        body = b"".join(message.get("body", b"") for message in messages)
+        self.assertIn("соль", body.decode())
+        self.assertTrue(messages[1]["more_body"])
+        self.assertFalse(messages[-1].get("more_body", False))
+
+
+class GunicornConfigTests(SimpleTestCase):
+    def test_asgi_mode_offloads_views(self):
+        # A fresh interpreter, as the gunicorn master process would be.
+        script = (
+            "import asyncio, runpy\n"
+            "runpy.run_path('gunicorn.conf.py')\n"
+            "import foodgram.asgi\n"
+            "from django.conf import settings\n"
+            "from api import urls\n"
+            "assert settings.ASYNC_VIEWS\n"
+            "assert all(\n"
+            "    asyncio.iscoroutinefunction(pattern.callback)\n"
+            "    for pattern in urls.urlpatterns\n"
+            "    if hasattr(pattern, 'callback')\n"
+            ")\n"
+        )
+        env = {
+            name: value
+            for name, value in os.environ.items()
+            if name not in ("ASYNC_VIEWS", "DJANGO_SETTINGS_MODULE")
+        }
+        env.update(SERVER_MODE="asgi", WEB_WORKERS="1")
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+@override_settings(DB_HEALTH_CHECK_IDLE=10)
+class ConnectionHealthCheckTests(SimpleTestCase):
+    def connection(self, idle, usable=True, **settings_dict):
+        connection = mock.Mock(in_atomic_block=False)
+        connection.settings_dict = {
+            "CONN_HEALTH_CHECKS": True,
+            **settings_dict,
+        }
+        connection.last_used = time.monotonic() - idle
+        connection.is_usable.return_value = usable
+        return connection
+
+    def check(self, *checked):
+        with mock.patch("api.connections.connections") as connections:
+            connections.all.return_value = checked
+            check_connections()
+
+    def test_idle_broken_connection_is_closed(self):
+        broken = self.connection(idle=60, usable=False)
+        healthy = self.connection(idle=60)
+        self.check(broken, healthy)
+        broken.close.assert_called_once()
+        healthy.is_usable.assert_called_once()
+        healthy.close.assert_not_called()
+
+    def test_recently_used_connection_is_not_checked(self):
+        recent = self.connection(idle=1, usable=False)
+        disabled = self.connection(
+            idle=60, usable=False, CONN_HEALTH_CHECKS=False
+        )
+        in_transaction = self.connection(idle=60, usable=False)
+        in_transaction.in_atomic_block = True
+        self.check(recent, disabled, in_transaction)
+        for connection in (recent, disabled, in_transaction):
+            connection.is_usable.assert_not_called()
+            connection.close.assert_not_called()
+
+
+class TokenCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user("tokens")
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_cached_token_skips_auth_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/recipes/shopping_list/")
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/recipes/shopping_list/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout_invalidates_token(self):
+        self.client.get("/api/recipes/shopping_list/")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get("/api/recipes/shopping_list/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_change_invalidates_token(self):
+        self.client.get("/api/recipes/shopping_list/")
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.user.pk).save(
+                update_fields=["last_login"]
+            )
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.user.pk)
+            user.is_active = False
+            user.save()
+        response = self.client.get("/api/recipes/shopping_list/")
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TOKEN_CACHE_SIZE=2, TOKEN_CACHE_TTL=30)
+    def test_entries_are_bounded_and_expire(self):
+        for key in ("first", "second", "third"):
+            token_cache.set(key, self.token)
+        self.assertIsNone(token_cache.get("first"))
+        self.assertIsNotNone(token_cache.get("second"))
+        with mock.patch("time.monotonic", return_value=time.monotonic() + 31):
+            self.assertIsNone(token_cache.get("third"))
+
+    @override_settings(TOKEN_CACHE_SHARED=True)
+    def test_shared_cache_serves_other_workers(self):
+        self.client.get("/api/recipes/shopping_list/")
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/recipes/shopping_list/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(token_cache._entries)
+        entry = cache.get(token_cache.make_key(self.token.key))
+        self.assertNotIn(self.user.password, entry["user"])
+        token = token_cache.get(self.token.key)
+        self.assertEqual(token.user.username, self.user.username)
+        self.assertTrue(token.user.check_password("password"))
+        key = self.token.key
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertIsNone(token_cache.get(key))
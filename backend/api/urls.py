@@ -1,9 +1,12 @@
-from django.urls import include, path
+from django.conf import settings
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from .offload import offload_patterns
 from .views import (
     FavoriteCreateDeleteView,
     IngredientApiViewSet,
+    MetricsView,
     RecipeModelViewSet,
     ShoppingCartCreateDeleteView,
     SubscribeCreateDeleteView,
@@ -19,7 +22,8 @@ router.register("recipes", RecipeModelViewSet, "recipes")
 
 
 urlpatterns = [
-    path("", include(router.urls)),
+    *router.urls,
+    path("metrics/", MetricsView.as_view(), name="metrics"),
     path(
         "users/<int:id>/subscribe/",
         SubscribeCreateDeleteView.as_view(),
@@ -36,3 +40,6 @@ urlpatterns = [
         name="shopping_cart",
     ),
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = offload_patterns(urlpatterns)
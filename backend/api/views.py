@@ -1,5 +1,13 @@
 from django.contrib.auth import get_user_model
-from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import (
+    BooleanField,
+    Count,
+    Prefetch,
+    Value,
+    prefetch_related_objects,
+)
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
@@ -7,53 +15,110 @@ from rest_framework import filters, generics, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from recipes.models import (
     Favorite,
     Ingredient,
-    IngredientRecipe,
     Recipe,
     ShoppingCart,
     Tag,
 )
+from recipes.autocomplete import ingredient_index
+from recipes.matching import recipe_ingredient_index
+from recipes.search import search_recipes
+from recipes.services import (
+    add_relation,
+    get_shopping_list,
+    remove_relation,
+)
 from users.models import Follow
 
+from .cache import (
+    apply_overlay,
+    get_or_set_versioned,
+    get_user_overlay,
+    not_modified,
+    recipe_lists_version,
+    recipe_relations_version,
+    recipe_version,
+    response_cache,
+    set_validators,
+    tags_version,
+    user_overlay_version,
+)
 from .filters import IngredientFilter, RecipeFilter
+from .paginators import CustomPageNumberPagination
 from .permissions import AdminOrAuthorOrReadOnly
+from .profiling import PrometheusRenderer, view_metrics
 from .serializers import (
     CreateRecipeSerializer,
     FavoriteSerializer,
     FollowSerializer,
     IngredientSerializer,
+    MatchedRecipeSerializer,
+    RecipeMatchingSerializer,
     RecipeSerializer,
     ShoppingCartSerializer,
     SubscribesSerializer,
     TagSerializer,
     UserSerializer,
 )
+from .shopping_list import RENDERERS
+from .signals import bump_on_commit
 
 User = get_user_model()
 
 
 class UserViewSet(DjoserUserViewSet):
 
+    pagination_class = CustomPageNumberPagination
+    query_budgets = {"following_list": 4}
+
     def get_queryset(self):
         if self.action == "following_list":
-            return User.objects.filter(following__user=self.request.user)
+            return (
+                User.objects.filter(following__user=self.request.user)
+                .annotate(
+                    recipes_count=Count("recipe", distinct=True),
+                    is_subscribed=Value(True, BooleanField()),
+                )
+                .order_by("id")
+            )
         return self.queryset
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get("recipes_limit", "")
+        if recipes_limit.isdigit():
+            return int(recipes_limit)
+        return None
+
     @action(
         detail=False,
         url_path="subscriptions",
         serializer_class=SubscribesSerializer,
+        permission_classes=(IsAuthenticated,),
     )
     def following_list(self, request):
-        return self.list(request)
+        page = self.paginate_queryset(self.get_queryset())
+        # Latest recipes of the authors on this page only.
+        prefetch_related_objects(
+            page,
+            Prefetch(
+                "recipe_set",
+                queryset=Recipe.objects.latest_per_author(
+                    self.get_recipes_limit(), page
+                ),
+            ),
+        )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class SubscribeCreateDeleteView(APIView):
@@ -61,118 +126,123 @@ class SubscribeCreateDeleteView(APIView):
     permission_classes = [
         IsAuthenticated,
     ]
+    query_budgets = {"get": 6, "delete": 2}
 
     def get(self, request, id):
 
         author = get_object_or_404(User, id=id)
         user = request.user
 
-        if Follow.objects.filter(user=user, author=author).exists():
+        if user == author:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        if user != author:
-            Follow.objects.get_or_create(
-                user=user,
-                author=author,
-            )
-            follow = Follow.objects.get(user=user, author=author)
-            serializer = FollowSerializer(follow)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        follow = add_relation(Follow, user=user, author=author)
+        if follow is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        serializer = FollowSerializer(follow)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
 
-        author = get_object_or_404(User, id=id)
-        user = request.user
-
-        if Follow.objects.filter(user=user, author=author).exists():
-            author = get_object_or_404(User, id=id)
-            user = request.user
-
-            subscribe = get_object_or_404(Follow, author=author, user=user)
-            subscribe.delete()
+        if remove_relation(Follow, user=request.user, author_id=id):
+            bump_on_commit(user_overlay_version(request.user.pk))
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 
 class TagApiViewSet(viewsets.ViewSet):
+    """
+    Tag catalogue served from a versioned cache.
+
+    Conditional requests matching the current version are answered with
+    304 before the database or the serializer is touched.
+    """
+
+    def get_catalog(self, version):
+        return get_or_set_versioned(
+            "tags",
+            version,
+            lambda: list(TagSerializer(Tag.objects.all(), many=True).data),
+        )
+
     def list(self, request):
-        queryset = Tag.objects.all()
-        serializer = TagSerializer(queryset, many=True)
-        return Response(serializer.data)
+        version = tags_version.get()
+        etag = version["etag"]
+        response = not_modified(request, etag, version)
+        if response is not None:
+            return response
+        return set_validators(
+            Response(self.get_catalog(version)), etag, version
+        )
 
     def retrieve(self, request, pk=None):
-        queryset = Tag.objects.all()
-        tag = get_object_or_404(queryset, pk=pk)
-        serializer = TagSerializer(tag)
-        return Response(serializer.data)
+        version = tags_version.get()
+        etag = f"{version['etag']}-{pk}"
+        response = not_modified(request, etag, version)
+        if response is not None:
+            return response
+        for tag in self.get_catalog(version):
+            if str(tag["id"]) == str(pk):
+                return set_validators(Response(tag), etag, version)
+        raise Http404
 
 
-class FavoriteCreateDeleteView(APIView):
+class RecipeRelationView(APIView):
+    """Adds a recipe to, or removes it from, a per-user recipe list."""
 
     permission_classes = [
         IsAuthenticated,
     ]
+    model = None
+    recipe_field = "recipe"
+    serializer_class = None
+    already_added_message = None
+    created_status = status.HTTP_201_CREATED
+    deleted_status = status.HTTP_204_NO_CONTENT
+    query_budgets = {"get": 6, "delete": 2}
 
     def get(self, request, id):
 
-        recipe = get_object_or_404(Recipe, id=id)
-        user = request.user
-
-        if Favorite.objects.filter(user=user, recipes=recipe).exists():
-            return Response(
-                "Вы уже добавили рецепт в избранное.",
-            )
-        Favorite.objects.get_or_create(
-            recipes=recipe,
-            user=user,
+        recipe = get_object_or_404(
+            Recipe.objects.only(
+                "id", "name", "image", "image_renditions", "cooking_time"
+            ),
+            id=id,
         )
-
-        favorite = Favorite.objects.get(recipes=recipe, user=user)
-        serializer = FavoriteSerializer(favorite)
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        relation = add_relation(
+            self.model, user=request.user, **{self.recipe_field: recipe}
+        )
+        if relation is None:
+            return Response(self.already_added_message)
+        serializer = self.serializer_class(
+            relation, context={"request": request}
+        )
+        return Response(serializer.data, status=self.created_status)
 
     def delete(self, request, id):
-        recipe = get_object_or_404(Recipe, id=id)
-        user = request.user
+        fields = {f"{self.recipe_field}_id": id}
+        if remove_relation(self.model, user=request.user, **fields):
+            bump_on_commit(user_overlay_version(request.user.pk))
+            return Response(status=self.deleted_status)
+        return Response(status=status.HTTP_404_NOT_FOUND)
 
-        favorite = get_object_or_404(Favorite, recipes=recipe, user=user)
-        favorite.delete()
-        return Response(status=status.HTTP_200_OK)
 
+class FavoriteCreateDeleteView(RecipeRelationView):
 
-class ShoppingCartCreateDeleteView(APIView):
+    model = Favorite
+    recipe_field = "recipes"
+    serializer_class = FavoriteSerializer
+    already_added_message = "Вы уже добавили рецепт в избранное."
+    created_status = status.HTTP_200_OK
+    deleted_status = status.HTTP_200_OK
 
-    permission_classes = [
-        IsAuthenticated,
-    ]
 
-    def get(self, request, id):
+class ShoppingCartCreateDeleteView(RecipeRelationView):
 
-        recipe = get_object_or_404(Recipe, id=id)
-        user = request.user
-
-        if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                "Вы уже добавили рецепт в список покупок.",
-            )
-        ShoppingCart.objects.get_or_create(
-            recipe=recipe,
-            user=user,
-        )
-
-        shop_cart = ShoppingCart.objects.get(recipe=recipe, user=user)
-        serializer = ShoppingCartSerializer(shop_cart)
-
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def delete(self, request, id):
-        recipe = get_object_or_404(Recipe, id=id)
-        user = request.user
-
-        shop_cart = get_object_or_404(ShoppingCart, recipe=recipe, user=user)
-        shop_cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    model = ShoppingCart
+    serializer_class = ShoppingCartSerializer
+    already_added_message = "Вы уже добавили рецепт в список покупок."
+    # Removal also updates and prunes the precomputed shopping list.
+    query_budgets = {"get": 6, "delete": 5}
 
 
 class IngredientApiViewSet(viewsets.ModelViewSet):
@@ -186,52 +256,171 @@ class IngredientApiViewSet(viewsets.ModelViewSet):
     ]
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return Response(
+            ingredient_index.search(request.query_params.get("name", ""))
+        )
+
 
 class RecipeModelViewSet(viewsets.ModelViewSet):
 
-    filter_class = RecipeFilter
+    filterset_class = RecipeFilter
     permission_classes = [AdminOrAuthorOrReadOnly]
+    pagination_class = CustomPageNumberPagination
     queryset = Recipe.objects.all()
 
+    personal_filters = ("is_favorited", "is_in_shopping_cart")
+    shared_response = False
+    query_budgets = {
+        "list": 9,
+        "retrieve": 4,
+        "create": 16,
+        "partial_update": 13,
+        "update": 13,
+        "destroy": 10,
+        "matching": 5,
+        "shopping_list": 2,
+        "download_shopping_cart": 2,
+    }
+
+    def get_queryset(self):
+        if self.action in ["list", "retrieve"]:
+            user = self.request.user
+            if self.shared_response:
+                user = AnonymousUser()
+            return (
+                self.queryset.with_relations()
+                .with_user_flags(user)
+                .order_by("-id")
+            )
+        return self.queryset
+
     def get_serializer_class(self):
         if self.action in ["list", "retrieve"]:
             return RecipeSerializer
         return CreateRecipeSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == "list":
+            context["image_rendition"] = "thumbnail"
+        return context
+
+    def get_shared_response(self, request, key, build):
+        """
+        Serve the user independent body of a recipe response from the
+        cache and overlay the flags of the requesting user.
+        """
+        self.shared_response = True
+        response = response_cache.get_or_set(key, build)
+        if request.user.is_authenticated and response.status_code == 200:
+            apply_overlay(response.data, get_user_overlay(request.user))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if any(
+            request.query_params.get(name) for name in self.personal_filters
+        ):
+            return super().list(request, *args, **kwargs)
+        key = response_cache.make_key(
+            request, recipe_lists_version.get()["etag"]
+        )
+        return self.get_shared_response(
+            request,
+            key,
+            lambda: super(RecipeModelViewSet, self).list(request),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        key = response_cache.make_key(
+            request,
+            recipe_version(kwargs["pk"]).get()["etag"],
+            recipe_relations_version.get()["etag"],
+        )
+        return self.get_shared_response(
+            request,
+            key,
+            lambda: super(RecipeModelViewSet, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
+    def search(self, queryset, query, after, limit):
+        return search_recipes(queryset, query, after, limit)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(methods=["get"], detail=False)
+    def matching(self, request):
+        """Recipes ranked by the share of their ingredients the user has."""
+        params = RecipeMatchingSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(
+            recipe_ingredient_index.match(
+                params.validated_data["ingredients"],
+                params.validated_data.get("max_missing"),
+            )
+        )
+        recipes = (
+            Recipe.objects.with_relations()
+            .with_user_flags(request.user)
+            .in_bulk([pk for pk, _, _ in page])
+        )
+        results = []
+        for pk, matched, total in page:
+            if pk in recipes:
+                recipe = recipes[pk]
+                recipe.coverage = matched / total
+                recipe.missing = total - matched
+                results.append(recipe)
+        serializer = MatchedRecipeSerializer(
+            results, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=(IsAdminUser,),
+    )
+    def cache_stats(self, request):
+        return Response(response_cache.stats())
+
     @action(
         methods=["get"],
         detail=False,
         permission_classes=(IsAuthenticated,),
     )
     def download_shopping_cart(self, request):
-        shopping_cart = ShoppingCart.objects.filter(user=request.user)
-        purchase_list = {}
-
-        for record in shopping_cart:
-            recipe = record.recipe
-            ingredients = IngredientRecipe.objects.filter(recipe=recipe)
-            for ingredient in ingredients:
-                amount = ingredient.amount
-                name = ingredient.ingredient.name
-                measurement_unit = ingredient.ingredient.measurement_unit
-                if name is not purchase_list:
-                    purchase_list[name] = {
-                        "measurement_unit": measurement_unit,
-                        "amount": amount,
-                    }
-                else:
-                    purchase_list[name]["amount"] += amount
-        wishlist = []
-        for item in purchase_list:
-            wishlist.append(
-                f'{item} - {purchase_list[item]["amount"]}'
-                f'{purchase_list[item]["measurement_unit"]}\n'
+        file_type = request.query_params.get("type", "pdf")
+        if file_type not in RENDERERS:
+            return Response(
+                {"type": f"Доступные форматы: {', '.join(RENDERERS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        wishlist.append("\n")
-        wishlist.append("FoodGram, 2021")
-        response = HttpResponse(wishlist, "Content-Type: application/pdf")
-        response["Content-Disposition"] = 'attachment; filename="wishlist.pdf"'
+        render, content_type = RENDERERS[file_type]
+        items = get_shopping_list(request.user).iterator()
+        response = StreamingHttpResponse(render(items), content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="wishlist.{file_type}"'
+        )
         return response
+
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_list(self, request):
+        return Response(list(get_shopping_list(request.user)))
+
+
+class MetricsView(APIView):
+    """Per-view query, latency and size totals of this worker process."""
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (JSONRenderer, PrometheusRenderer)
+
+    def get(self, request):
+        return Response(view_metrics.snapshot())
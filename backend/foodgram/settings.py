@@ -3,6 +3,8 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from foodgram.utils import env_bool, env_int
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-(6ge86=v8%jf=^&45nrm51k!8v!e2@94svhd-(lk9pt+km5f*6'
@@ -33,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,9 +84,46 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("DB_HOST"),
         "PORT": os.environ.get("DB_PORT"),
+        # Seconds a connection is kept for later requests, 0 closes it
+        # at the end of every request.
+        "CONN_MAX_AGE": env_int("DB_CONN_MAX_AGE", 60),
+        # Persistent connections idle for DB_HEALTH_CHECK_IDLE seconds are
+        # checked before reuse, see api.connections.
+        "CONN_HEALTH_CHECKS": env_bool("DB_HEALTH_CHECKS", True),
+        # PgBouncer in transaction pooling mode cannot keep the named
+        # cursors of QuerySet.iterator() open across transactions.
+        "DISABLE_SERVER_SIDE_CURSORS": env_bool("DB_PGBOUNCER"),
     }
 }
 
+DB_HEALTH_CHECK_IDLE = env_int('DB_HEALTH_CHECK_IDLE', 10)
+# Database connections held by one server worker at most: each thread
+# running views keeps its own.
+DB_POOL_SIZE = env_int('DB_POOL_SIZE', 16)
+
+# Local memory caches are private to one process. Deployments with several
+# workers need a shared backend for both aliases, e.g.
+# CACHE_BACKEND=django_redis.cache.RedisCache with
+# CACHE_LOCATION=redis://cache:6379/0 as in infra/docker-compose.yml.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    'responses': {
+        'BACKEND': os.environ.get(
+            'RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'responses'),
+    },
+}
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = env_int('RESPONSE_CACHE_TIMEOUT', 600)
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -104,7 +144,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachingTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.'
                                 'PageNumberPagination',
@@ -114,6 +154,17 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Token lookups are cached per process for TOKEN_CACHE_TTL seconds, the
+# longest another worker may accept a token after logout. With
+# TOKEN_CACHE_SHARED they are kept only in the shared cache, and logout
+# applies to every worker at once.
+TOKEN_CACHE_SIZE = env_int('TOKEN_CACHE_SIZE', 10000)
+TOKEN_CACHE_TTL = env_int('TOKEN_CACHE_TTL', 30)
+TOKEN_CACHE_SHARED = env_bool('TOKEN_CACHE_SHARED')
+TOKEN_CACHE_SHARED_TTL = env_int('TOKEN_CACHE_SHARED_TTL', 600)
+
+PAGINATION_COUNT_CACHE_TIMEOUT = env_int('PAGINATION_COUNT_CACHE_TIMEOUT', 0)
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email',
@@ -143,3 +194,22 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+IMAGE_RENDITION_WORKERS = env_int('IMAGE_RENDITION_WORKERS', 2)
+RECIPE_IMAGE_MAX_PIXELS = env_int('RECIPE_IMAGE_MAX_PIXELS', 40_000_000)
+
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'russian')
+
+# Off by default: profiling wraps DRF serializers and times every query.
+PROFILING_ENABLED = env_bool('PROFILING_ENABLED')
+QUERY_BUDGET_STRICT = env_bool('QUERY_BUDGET_STRICT')
+TEST_RUNNER = 'api.profiling.QueryBudgetTestRunner'
+
+# Set by foodgram.asgi: API views run in a thread pool of this size.
+ASYNC_VIEWS = env_bool('ASYNC_VIEWS')
+ASYNC_VIEW_THREADS = env_int('ASYNC_VIEW_THREADS', DB_POOL_SIZE)
+
+SHOPPING_LIST_FONT = os.environ.get(
+    'SHOPPING_LIST_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
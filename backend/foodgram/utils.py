@@ -56,4 +56,18 @@ def load_env(path: Path):
             value = value.replace(replace, os.environ.get(name, ''))
 
         # Set environment value
-        os.environ[name] = value
\ No newline at end of file
+        os.environ[name] = value
+
+
+def env_bool(name, default=False):
+    """Boolean environment setting, accepting 1/0 and the load_env aliases."""
+    value = os.environ.get(name, '').strip().lower()
+    if not value:
+        return default
+    return aliases.get(value, value == '1')
+
+
+def env_int(name, default):
+    """Integer environment setting, the default when unset or empty."""
+    value = os.environ.get(name, '').strip()
+    return int(value) if value else default
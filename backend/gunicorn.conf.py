@@ -0,0 +1,69 @@
+"""
+Gunicorn worker profile, configured from the environment.
+
+SERVER_MODE=wsgi (the default) serves foodgram.wsgi with the classic sync
+workers.
+SERVER_MODE=asgi serves foodgram.asgi with uvicorn workers, one per core:
+each runs API views in a pool of DB_POOL_SIZE threads (or
+ASYNC_VIEW_THREADS), so it overlaps database round trips of concurrent
+requests. It only paid off for authenticated traffic in load_test runs,
+cached anonymous reads were faster on wsgi.
+"""
+
+import multiprocessing
+import os
+
+from foodgram.utils import env_int
+
+mode = os.environ.get("SERVER_MODE", "wsgi")
+cores = multiprocessing.cpu_count()
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+if mode == "asgi":
+    wsgi_app = "foodgram.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    # Workers inherit the environment of the master process.
+    os.environ["ASYNC_VIEWS"] = "1"
+    workers = env_int("WEB_WORKERS", cores)
+else:
+    wsgi_app = "foodgram.wsgi:application"
+    worker_class = "sync"
+    workers = env_int("WEB_WORKERS", 2 * cores + 1)
+timeout = env_int("WEB_TIMEOUT", 30)
+keepalive = env_int("WEB_KEEPALIVE", 5)
+# Recycle workers now and then to bound slow memory growth.
+max_requests = env_int("WEB_MAX_REQUESTS", 5000)
+max_requests_jitter = max_requests // 10
+
+# Workers learn about data changes through version stamps in the cache, so
+# with a per-process cache they would keep serving outdated indexes and
+# responses until they are recycled.
+if workers > 1:
+    for variable in ("CACHE_BACKEND", "RESPONSE_CACHE_BACKEND"):
+        if "locmem" in os.environ.get(variable, "locmem"):
+            raise RuntimeError(
+                f"{workers} workers need a shared cache, set {variable} "
+                "(see infra/docker-compose.yml) or WEB_WORKERS=1"
+            )
+
+# Every view thread and image rendition thread of a worker keeps its own
+# database connection; all of them together must fit into the server's
+# max_connections, or into PgBouncer's pool. The settings module is not
+# imported here, so that the workers load it with ASYNC_VIEWS already set.
+pool_size = env_int("ASYNC_VIEW_THREADS", env_int("DB_POOL_SIZE", 16))
+connections_per_worker = (pool_size if mode == "asgi" else 1) + env_int(
+    "IMAGE_RENDITION_WORKERS", 2
+)
+
+
+def when_ready(server):
+    limit = env_int("DB_MAX_CONNECTIONS", 100)
+    total = workers * connections_per_worker
+    if total > limit:
+        server.log.warning(
+            "%s workers may open %s database connections, more than "
+            "DB_MAX_CONNECTIONS=%s; lower WEB_WORKERS or DB_POOL_SIZE",
+            workers,
+            total,
+            limit,
+        )
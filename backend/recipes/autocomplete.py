@@ -0,0 +1,81 @@
+import threading
+import uuid
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from .models import Ingredient
+
+
+class VersionedIndex:
+    """
+    In-memory structure loaded lazily once per process.
+
+    It is rebuilt when the shared version key changes, so every worker
+    picks up invalidations and lookups never hit the database.
+    """
+
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+
+    def load(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        self._index = None
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+
+    def get_index(self):
+        version = cache.get(self.version_key)
+        index = self._index
+        if index is not None and self._version == version:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or self._version != version:
+                index = self._index = self.load()
+                self._version = version
+            return index
+
+
+class IngredientPrefixIndex(VersionedIndex):
+    """
+    Sorted copy of the ingredient catalogue.
+
+    Prefix matches come first, then names containing the query.
+    """
+
+    version_key = "ingredient-index-version"
+
+    def load(self):
+        rows = sorted(
+            Ingredient.objects.values_list("id", "name", "measurement_unit"),
+            key=lambda row: (row[1].casefold(), row[0]),
+        )
+        keys = [name.casefold() for _, name, _ in rows]
+        items = [
+            {"id": pk, "name": name, "measurement_unit": unit}
+            for pk, name, unit in rows
+        ]
+        return keys, items
+
+    def search(self, query=""):
+        keys, items = self.get_index()
+        query = query.strip().casefold()
+        if not query:
+            return list(items)
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + "\U0010ffff", start)
+        contains = [
+            item
+            for key, item in zip(keys, items)
+            if query in key and not key.startswith(query)
+        ]
+        return items[start:end] + contains
+
+
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+
+UNIQUE_KEYS = (
+    ("ingredients", "Ingredient", ("name", "measurement_unit")),
+    ("recipe ingredients", "IngredientRecipe", ("recipe", "ingredient")),
+    ("favorites", "Favorite", ("user", "recipes")),
+    ("shopping cart", "ShoppingCart", ("user", "recipe")),
+)
+
+
+def find_duplicates(model, fields):
+    """Groups of rows sharing ``fields``, with the id of the row to keep."""
+    lookups = {f"{field}__isnull": False for field in fields}
+    return (
+        model.objects.filter(**lookups)
+        .values(*fields)
+        .annotate(keep_id=Min("id"), rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+
+
+def duplicated_rows(model, group, fields):
+    return model.objects.filter(
+        **{field: group[field] for field in fields}
+    ).exclude(id=group["keep_id"])
+
+
+def collapse_ingredients(ingredient_model, ingredient_recipe_model):
+    fields = ("name", "measurement_unit")
+    removed = 0
+    for group in find_duplicates(ingredient_model, fields):
+        duplicates = duplicated_rows(ingredient_model, group, fields)
+        ingredient_recipe_model.objects.filter(
+            ingredient__in=duplicates
+        ).update(ingredient_id=group["keep_id"])
+        removed += duplicates.delete()[0]
+    return removed
+
+
+def collapse_ingredient_rows(ingredient_recipe_model):
+    fields = ("recipe", "ingredient")
+    removed = 0
+    for group in find_duplicates(ingredient_recipe_model, fields):
+        rows = ingredient_recipe_model.objects.filter(
+            recipe=group["recipe"], ingredient=group["ingredient"]
+        )
+        total = rows.aggregate(total=Sum("amount"))["total"]
+        rows.filter(id=group["keep_id"]).update(amount=total)
+        removed += rows.exclude(id=group["keep_id"]).delete()[0]
+    return removed
+
+
+def collapse_rows(model, fields):
+    removed = 0
+    for group in find_duplicates(model, fields):
+        removed += duplicated_rows(model, group, fields).delete()[0]
+    return removed
+
+
+def report_duplicates(get_model):
+    """Number of surplus rows per model that violate the unique keys."""
+    return {
+        label: sum(
+            group["rows"] - 1
+            for group in find_duplicates(get_model("recipes", name), fields)
+        )
+        for label, name, fields in UNIQUE_KEYS
+    }
+
+
+@transaction.atomic
+def collapse_duplicates(get_model):
+    """Collapse duplicates in dependency order, returns removed rows."""
+    ingredient = get_model("recipes", "Ingredient")
+    ingredient_recipe = get_model("recipes", "IngredientRecipe")
+    removed = {
+        "ingredients": collapse_ingredients(ingredient, ingredient_recipe),
+        "recipe ingredients": collapse_ingredient_rows(ingredient_recipe),
+    }
+    for label, name, fields in UNIQUE_KEYS[2:]:
+        removed[label] = collapse_rows(get_model("recipes", name), fields)
+    return removed
@@ -0,0 +1,138 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = "recipes/renditions"
+SIZES = {"thumbnail": (320, 320), "medium": (960, 960)}
+FORMATS = {
+    "": (
+        "JPEG",
+        "jpg",
+        {"quality": 85, "optimize": True, "progressive": True},
+    ),
+    "_webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+}
+
+RENDITIONS = tuple(size + suffix for size in SIZES for suffix in FORMATS)
+
+renditions_ready = Signal()
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_RENDITION_WORKERS,
+            thread_name_prefix="renditions",
+        )
+    return _executor
+
+
+def encode_renditions(file):
+    """Encoded renditions of an image file as {name: (extension, bytes)}."""
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    encoded = {}
+    for size_name, size in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        for suffix, (image_format, extension, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            encoded[size_name + suffix] = (extension, buffer.getvalue())
+    return encoded
+
+
+def find_renditions(source):
+    """Renditions of the same image already rendered for another recipe."""
+    for renditions in Recipe.objects.filter(
+        image_renditions__source=source
+    ).values_list("image_renditions", flat=True)[:1]:
+        if all(
+            image_storage.exists(renditions.get(name, ""))
+            for name in RENDITIONS
+        ):
+            return renditions
+    return None
+
+
+def store_renditions(source):
+    with image_storage.open(source) as file:
+        encoded = encode_renditions(file)
+    renditions = {"source": source}
+    for name, (extension, content) in encoded.items():
+        renditions[name] = image_storage.save(
+            f"{RENDITION_DIR}/{name}.{extension}", ContentFile(content)
+        )
+    return renditions
+
+
+def render_renditions(recipe_id, source):
+    """
+    Attach renditions of ``source`` to the recipe, unless its image was
+    replaced in the meantime. Files no longer referenced are left to the
+    collect_images command, as other recipes may share them.
+    """
+    renditions = find_renditions(source) or store_renditions(source)
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        image_renditions=renditions
+    )
+    if not updated:
+        return None
+    renditions_ready.send(sender=Recipe, recipe_id=recipe_id)
+    return renditions
+
+
+def run_in_worker(recipe_id, source):
+    close_old_connections()
+    try:
+        render_renditions(recipe_id, source)
+    except Exception:
+        logger.exception("Could not render renditions of %s", source)
+    finally:
+        close_old_connections()
+
+
+def get_rendition_names(recipe):
+    """
+    Storage names of the recipe image renditions; the original image
+    stands in for all of them until they are rendered.
+    """
+    if not recipe.image:
+        return {}
+    renditions = recipe.image_renditions
+    if renditions.get("source") != recipe.image.name:
+        renditions = {}
+    return {
+        name: renditions.get(name, recipe.image.name) for name in RENDITIONS
+    }
+
+
+def schedule_renditions(recipe):
+    """Render renditions of the recipe image after the transaction ends."""
+    if not recipe.image:
+        return
+    source = recipe.image.name
+    if recipe.image_renditions.get("source") == source:
+        return
+
+    def submit():
+        if settings.IMAGE_RENDITION_WORKERS:
+            get_executor().submit(run_in_worker, recipe.pk, source)
+        else:
+            render_renditions(recipe.pk, source)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,49 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.filters import IngredientFilter
+from api.serializers import IngredientSerializer
+from recipes.autocomplete import IngredientPrefixIndex
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = "Compares ingredient autocomplete: ORM filter vs prefix index"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lookups", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list("name", flat=True))
+        if not names:
+            self.stderr.write("No ingredients loaded, run load_data first.")
+            return
+        rng = random.Random(options["seed"])
+        queries = [
+            name[: rng.randint(1, 4)]
+            for name in rng.choices(names, k=options["lookups"])
+        ]
+        index = IngredientPrefixIndex()
+        index.get_index()
+
+        self.report("orm filter", queries, self.orm_lookup)
+        self.report("prefix index", queries, index.search)
+
+    def orm_lookup(self, query):
+        queryset = IngredientFilter(
+            {"name": query}, queryset=Ingredient.objects.all()
+        ).qs
+        return IngredientSerializer(queryset, many=True).data
+
+    def report(self, label, queries, lookup):
+        started = time.perf_counter()
+        for query in queries:
+            lookup(query)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:>12}: {len(queries)} lookups in {elapsed:.3f}s, "
+            f"{elapsed / len(queries) * 1e6:.0f} us per lookup"
+        )
@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from recipes.duplicates import collapse_duplicates, report_duplicates
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports rows violating the unique keys of recipes tables "
+        "and collapses them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report duplicates, do not change anything.",
+        )
+
+    def handle(self, *args, **options):
+        for label, count in report_duplicates(apps.get_model).items():
+            self.stdout.write(f"{label}: {count} duplicate rows")
+        if options["dry_run"]:
+            return
+        for label, count in collapse_duplicates(apps.get_model).items():
+            self.stdout.write(
+                self.style.SUCCESS(f"{label}: {count} rows removed")
+            )
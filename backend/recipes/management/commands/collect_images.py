@@ -0,0 +1,88 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import RENDITION_DIR, RENDITIONS
+from recipes.models import Recipe
+from recipes.storage import image_storage
+
+IMAGE_DIRS = (Recipe._meta.get_field("image").upload_to, RENDITION_DIR)
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        if not name.startswith("."):
+            yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = (
+        "Counts references from recipes to stored images and renditions "
+        "and deletes files nothing refers to"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=60,
+            help=(
+                "Keep orphans younger than this many minutes, they may "
+                "belong to a transaction that has not committed yet."
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be deleted.",
+        )
+
+    def count_references(self):
+        references = Counter()
+        for image, renditions in Recipe.objects.values_list(
+            "image", "image_renditions"
+        ).iterator():
+            if image:
+                references[image] += 1
+            for name in RENDITIONS:
+                if name in renditions:
+                    references[renditions[name]] += 1
+        return references
+
+    def handle(self, *args, **options):
+        # Files stored, or stored again, after the references are counted
+        # are newer than the cut-off, so they are never mistaken for
+        # orphans.
+        cutoff = timezone.now() - timedelta(minutes=options["grace"])
+        references = self.count_references()
+        stored = shared = orphans = reclaimed = 0
+        for directory in IMAGE_DIRS:
+            if not image_storage.exists(directory):
+                continue
+            for name in walk(image_storage, directory.rstrip("/")):
+                stored += 1
+                if references[name] > 1:
+                    shared += 1
+                if references[name]:
+                    continue
+                if image_storage.get_modified_time(name) > cutoff:
+                    continue
+                orphans += 1
+                reclaimed += image_storage.size(name)
+                if options["verbosity"] > 1:
+                    self.stdout.write(f"- {name}")
+                if not options["dry_run"]:
+                    image_storage.delete(name)
+        verb = "would be deleted" if options["dry_run"] else "deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{stored} files, {shared} shared by several references, "
+                f"{orphans} orphans {verb} ({reclaimed / 1024:.0f} KiB)"
+            )
+        )
@@ -1,18 +1,182 @@
 import csv
+import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
 
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.autocomplete import ingredient_index
 from recipes.models import Ingredient
 
+DEFAULT_PATH = Path(settings.BASE_DIR, "recipes", "data", "ingredients.csv")
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r"\s*")
+
+
+def read_csv(path):
+    with open(path, encoding="utf-8", newline="") as file:
+        for row in csv.reader(file):
+            if len(row) == 2:
+                yield row
+
+
+def parse_items(items):
+    for item in items:
+        yield (
+            item.get("name", item.get("title", "")),
+            item.get("measurement_unit", item.get("dimension", "")),
+        )
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """
+    Items of the JSON array in ``file``, decoded one at a time.
+
+    Only the current chunk and the item being decoded are kept in memory,
+    so a large array loads as lazily as JSON Lines do.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+    state = "start"
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                raise CommandError(f"{file.name} ends inside the array")
+            buffer, position = file.read(chunk_size), 0
+            eof = not buffer
+            continue
+        char = buffer[position]
+        if state == "start":
+            if char != "[":
+                raise CommandError(f"{file.name} is not a JSON array")
+            state, position = "first", position + 1
+        elif state in ("first", "next") and char == "]":
+            return
+        elif state == "next":
+            if char != ",":
+                raise CommandError(f"{file.name} is not a JSON array")
+            state, position = "item", position + 1
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                end = None
+            # An item touching the end of the chunk may continue in the
+            # next one, e.g. a number.
+            if end is None or (end == len(buffer) and not eof):
+                chunk = file.read(chunk_size)
+                buffer, position = buffer[position:] + chunk, 0
+                eof = not chunk
+                continue
+            yield item
+            state, position = "next", end
+
+
+def read_json(path):
+    with open(path, encoding="utf-8") as file:
+        yield from parse_items(iter_json_array(file))
+
+
+def read_json_lines(path):
+    with open(path, encoding="utf-8") as file:
+        yield from parse_items(
+            json.loads(line) for line in file if line.strip()
+        )
+
+
+READERS = {"csv": read_csv, "json": read_json, "jsonl": read_json_lines}
+
+
+def unique_rows(rows, seen):
+    for name, unit in rows:
+        key = (name.strip(), unit.strip())
+        if key[0] and key not in seen:
+            seen.add(key)
+            yield key
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
-    help = "Closes the specified poll for voting"
+    help = "Loads ingredients from CSV or JSON files"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            type=Path,
+            default=[DEFAULT_PATH],
+            help="CSV (name,unit), JSON array or JSON Lines files, all "
+            "read incrementally.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="Input format, guessed from the extension by default.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report how many ingredients are new without saving.",
+        )
 
     def handle(self, *args, **options):
-        with open("recipes/data/ingredients.csv") as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, unit = row
-                Ingredient.objects.get_or_create(
-                    name=name, measurement_unit=unit
-                )
+        started = time.perf_counter()
+        existing = set(
+            Ingredient.objects.values_list("name", "measurement_unit")
+        )
+        seen = set(existing)
+        read = 0
+        with transaction.atomic():
+            for path in options["paths"]:
+                rows = self.read(path, options["format"])
+                for batch in batches(
+                    unique_rows(rows, seen), options["batch_size"]
+                ):
+                    read += len(batch)
+                    if options["dry_run"]:
+                        if options["verbosity"] > 1:
+                            for name, unit in batch:
+                                self.stdout.write(f"+ {name}, {unit}")
+                        continue
+                    Ingredient.objects.bulk_create(
+                        (
+                            Ingredient(name=name, measurement_unit=unit)
+                            for name, unit in batch
+                        ),
+                        batch_size=options["batch_size"],
+                        ignore_conflicts=True,
+                    )
+            if read and not options["dry_run"]:
+                transaction.on_commit(ingredient_index.invalidate)
+        elapsed = time.perf_counter() - started
+        verb = "would be added" if options["dry_run"] else "added"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{read} new ingredients {verb}, {len(existing)} already "
+                f"present, {elapsed:.2f}s ({read / elapsed:.0f} rows/s)"
+            )
+        )
+
+    def read(self, path, file_format):
+        file_format = file_format or path.suffix.lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unknown format of {path}")
+        if not path.exists():
+            raise CommandError(f"{path} does not exist")
+        return READERS[file_format](path)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.search import (
+    is_postgres,
+    recipe_search_index,
+    update_search_vectors,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes recipe search vectors, e.g. after bulk imports that "
+        "bypass model signals"
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if is_postgres():
+            update_search_vectors()
+        recipe_search_index.invalidate()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Search index rebuilt in {elapsed:.2f}s.")
+        )
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+from recipes.services import aggregate_shopping_lists, rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes shopping lists from carts, reports the difference "
+        "with the incrementally maintained totals and replaces them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the difference, fail if there is any.",
+        )
+
+    def handle(self, *args, **options):
+        expected = {
+            (row["user_id"], row["ingredient_id"]): row["amount"]
+            for row in aggregate_shopping_lists()
+        }
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in (
+                ShoppingListItem.objects.values_list(
+                    "user_id", "ingredient_id", "amount"
+                )
+            )
+        }
+        missing = expected.keys() - actual.keys()
+        extra = actual.keys() - expected.keys()
+        wrong = {
+            key
+            for key in expected.keys() & actual.keys()
+            if expected[key] != actual[key]
+        }
+        if options["verbosity"] > 1:
+            for key in sorted(missing | extra | wrong):
+                self.stdout.write(
+                    "user {}, ingredient {}: expected {}, stored {}".format(
+                        *key, expected.get(key), actual.get(key)
+                    )
+                )
+        self.stdout.write(
+            f"{len(expected)} expected rows: {len(missing)} missing, "
+            f"{len(extra)} extra, {len(wrong)} with a wrong amount"
+        )
+        if options["check"]:
+            if missing or extra or wrong:
+                raise CommandError("Shopping lists are inconsistent.")
+            return
+        rebuild_shopping_lists()
+        self.stdout.write(self.style.SUCCESS("Shopping lists rebuilt."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import render_renditions
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders missing recipe image renditions, e.g. for uploads whose "
+        "background job was lost on a restart"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Render renditions of every image again.",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="").exclude(image__isnull=True)
+        rendered = failed = 0
+        for pk, image, renditions in recipes.values_list(
+            "pk", "image", "image_renditions"
+        ).iterator():
+            if not options["all"] and renditions.get("source") == image:
+                continue
+            try:
+                render_renditions(pk, image)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f"recipe {pk}: {error}")
+            else:
+                rendered += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"{rendered} images rendered, {failed} failed.")
+        )
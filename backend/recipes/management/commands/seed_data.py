@@ -0,0 +1,312 @@
+import random
+import time
+from bisect import bisect
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import recipe_lists_version, tags_version
+from recipes.autocomplete import ingredient_index
+from recipes.matching import recipe_ingredient_index
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import (
+    is_postgres,
+    recipe_search_index,
+    update_search_vectors,
+)
+from recipes.services import rebuild_shopping_lists
+from users.models import Follow
+
+User = get_user_model()
+
+WORDS = (
+    "суп",
+    "салат",
+    "пирог",
+    "каша",
+    "омлет",
+    "рагу",
+    "запеканка",
+    "соус",
+    "котлеты",
+    "блины",
+    "домашний",
+    "быстрый",
+    "острый",
+    "летний",
+    "сырный",
+    "овощной",
+    "куриный",
+    "грибной",
+)
+
+UNITS = ("г", "мл", "шт")
+
+
+class Skewed:
+    """Zipf-like draws: the item of rank r is picked with weight 1/r^s."""
+
+    def __init__(self, items, skew, rng):
+        self.items = list(items)
+        self.rng = rng
+        self.cum_weights = list(
+            accumulate(1 / rank**skew for rank in range(1, len(items) + 1))
+        )
+
+    def choice(self):
+        point = self.rng.random() * self.cum_weights[-1]
+        return self.items[bisect(self.cum_weights, point)]
+
+    def sample(self, k):
+        """Up to k distinct items in a reproducible order."""
+        k = min(k, len(self.items))
+        chosen = set()
+        while len(chosen) < k:
+            chosen.add(self.choice())
+        return sorted(chosen)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds reproducible synthetic users, tags, recipes, follows, "
+        "favorites and carts with skewed popularity for load tests"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--tags", type=int, default=12)
+        parser.add_argument("--recipes", type=int, default=10000)
+        parser.add_argument(
+            "--ingredients",
+            type=int,
+            default=1000,
+            help="Create synthetic ingredients up to this many.",
+        )
+        parser.add_argument(
+            "--ingredients-per-recipe",
+            type=int,
+            default=8,
+            help="Average number of ingredients of a recipe.",
+        )
+        parser.add_argument(
+            "--follows", type=int, default=10, help="Average per user."
+        )
+        parser.add_argument(
+            "--favorites", type=int, default=20, help="Average per user."
+        )
+        parser.add_argument(
+            "--carts", type=int, default=5, help="Average per user."
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of author, tag and recipe popularity.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="seed-")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete data seeded earlier with the same prefix first.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        self.rng = random.Random(options["seed"])
+        self.prefix = options["prefix"]
+        self.batch_size = options["batch_size"]
+        with transaction.atomic():
+            if options["clear"]:
+                self.clear()
+            counts = self.seed(options)
+            transaction.on_commit(self.invalidate)
+        elapsed = time.perf_counter() - started
+        summary = ", ".join(f"{count} {name}" for name, count in counts)
+        self.stdout.write(
+            self.style.SUCCESS(f"Seeded {summary} in {elapsed:.1f}s.")
+        )
+
+    def clear(self):
+        User.objects.filter(username__startswith=self.prefix).delete()
+        Tag.objects.filter(slug__startswith=self.prefix).delete()
+        Ingredient.objects.filter(name__startswith=self.prefix).delete()
+
+    def invalidate(self):
+        tags_version.bump()
+        recipe_lists_version.bump()
+        ingredient_index.invalidate()
+        recipe_ingredient_index.invalidate()
+        recipe_search_index.invalidate()
+
+    def around(self, average):
+        """Count drawn uniformly from 0..2*average."""
+        return self.rng.randint(0, 2 * average)
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def seed(self, options):
+        rng = self.rng
+        users = self.seed_users(options["users"])
+        tags = self.seed_tags(options["tags"])
+        ingredients = self.seed_ingredients(options["ingredients"])
+        # Popularity ranks are shuffled so that they do not follow ids.
+        authors = Skewed(rng.sample(users, len(users)), options["skew"], rng)
+        popular_tags = Skewed(tags, options["skew"], rng)
+        staples = Skewed(
+            rng.sample(ingredients, len(ingredients)), options["skew"], rng
+        )
+        self.bulk_create(
+            Recipe,
+            (
+                Recipe(
+                    author_id=authors.choice(),
+                    name=f"{rng.choice(WORDS)} {rng.choice(WORDS)} {number}",
+                    text=" ".join(rng.choices(WORDS, k=rng.randint(5, 40))),
+                    cooking_time=max(1, int(rng.lognormvariate(3.4, 0.6))),
+                )
+                for number in range(options["recipes"])
+            ),
+        )
+        recipes = list(
+            Recipe.objects.filter(author__username__startswith=self.prefix)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        self.bulk_create(
+            Recipe.tags.through,
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in popular_tags.sample(rng.randint(1, 3))
+            ),
+        )
+        per_recipe = options["ingredients_per_recipe"]
+        self.bulk_create(
+            IngredientRecipe,
+            (
+                IngredientRecipe(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=rng.choice((1, 2, 3, 5, 10, 50, 100, 200, 500)),
+                )
+                for recipe in recipes
+                for ingredient in staples.sample(
+                    max(1, self.around(per_recipe))
+                )
+            ),
+        )
+        popular_recipes = Skewed(
+            rng.sample(recipes, len(recipes)), options["skew"], rng
+        )
+        self.bulk_create(
+            Follow,
+            (
+                Follow(user_id=user, author_id=author)
+                for user in users
+                for author in authors.sample(self.around(options["follows"]))
+                if author != user
+            ),
+        )
+        self.bulk_create(
+            Favorite,
+            (
+                Favorite(user_id=user, recipes_id=recipe)
+                for user in users
+                for recipe in popular_recipes.sample(
+                    self.around(options["favorites"])
+                )
+            ),
+        )
+        self.bulk_create(
+            ShoppingCart,
+            (
+                ShoppingCart(user_id=user, recipe_id=recipe)
+                for user in users
+                for recipe in popular_recipes.sample(
+                    self.around(options["carts"])
+                )
+            ),
+        )
+        # Bulk inserts bypass the signals maintaining derived data.
+        rebuild_shopping_lists()
+        if is_postgres():
+            update_search_vectors(recipes)
+        return (
+            ("users", len(users)),
+            ("tags", len(tags)),
+            ("recipes", len(recipes)),
+            (
+                "recipe ingredients",
+                IngredientRecipe.objects.filter(recipe__in=recipes).count(),
+            ),
+        )
+
+    def seed_users(self, count):
+        password = make_password(None)
+        self.bulk_create(
+            User,
+            (
+                User(
+                    username=f"{self.prefix}user-{number}",
+                    email=f"{self.prefix}user-{number}@foodgram.test",
+                    first_name=f"Имя {number}",
+                    last_name=f"Фамилия {number}",
+                    password=password,
+                )
+                for number in range(count)
+            ),
+        )
+        return list(
+            User.objects.filter(username__startswith=self.prefix)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def seed_tags(self, count):
+        self.bulk_create(
+            Tag,
+            (
+                Tag(
+                    name=f"Тэг {number}",
+                    slug=f"{self.prefix}tag-{number}",
+                    color=f"#{self.rng.randrange(0x1000000):06x}",
+                )
+                for number in range(count)
+            ),
+        )
+        return list(
+            Tag.objects.filter(slug__startswith=self.prefix)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def seed_ingredients(self, count):
+        """Existing ingredients topped up with synthetic ones."""
+        missing = count - Ingredient.objects.count()
+        if missing > 0:
+            self.bulk_create(
+                Ingredient,
+                (
+                    Ingredient(
+                        name=f"{self.prefix}ингредиент {number}",
+                        measurement_unit=UNITS[number % len(UNITS)],
+                    )
+                    for number in range(missing)
+                ),
+            )
+        return list(
+            Ingredient.objects.order_by("id").values_list("id", flat=True)
+        )
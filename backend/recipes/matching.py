@@ -0,0 +1,172 @@
+import heapq
+import threading
+import uuid
+from collections import Counter
+from itertools import chain
+
+from django.core.cache import cache
+
+from .models import IngredientRecipe
+from .services import CommitBatch
+
+CHANGE_TIMEOUT = 60 * 60
+
+
+def rank(row):
+    pk, matched, total = row
+    return -matched / total, total - matched, -matched, -pk
+
+
+class RankedMatches:
+    """
+    Matches of ``RecipeIngredientIndex.match`` ranked lazily: counting
+    them costs nothing and a slice only ranks the rows up to its end, so
+    a page costs O(n log k) rather than sorting every match.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            index = range(len(self.rows))[index]
+            end = index + 1
+            return self[index:end][0]
+        start, stop, step = index.indices(len(self.rows))
+        return heapq.nsmallest(stop, self.rows, key=rank)[start:stop:step]
+
+    def __iter__(self):
+        return iter(sorted(self.rows, key=rank))
+
+
+class RecipeIngredientIndex:
+    """
+    Inverted index from ingredients to the recipes using them.
+
+    Loaded once per process. Writers append the ids of changed recipes to
+    a change log in the shared cache, and readers replay the log by
+    reloading only those recipes; a full reload happens when the log is
+    too long or has expired. Published structures are never mutated, so
+    lookups run without locking.
+    """
+
+    sequence_key = "recipe-ingredients-sequence"
+    epoch_key = "recipe-ingredients-epoch"
+    change_key = "recipe-ingredients-change:{}"
+    max_replay = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._epoch = None
+        self._sequence = None
+
+    def record_change(self, recipe_ids):
+        cache.add(self.epoch_key, uuid.uuid4().hex, None)
+        cache.add(self.sequence_key, 0, None)
+        sequence = cache.incr(self.sequence_key)
+        cache.set(
+            self.change_key.format(sequence), list(recipe_ids), CHANGE_TIMEOUT
+        )
+
+    def invalidate(self):
+        """Force a full reload, e.g. after bulk imports."""
+        cache.delete(self.epoch_key)
+
+    def read_rows(self, recipe_ids=None):
+        rows = IngredientRecipe.objects.filter(ingredient__isnull=False)
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        recipes = {pk: set() for pk in recipe_ids or ()}
+        for recipe_id, ingredient_id in rows.values_list(
+            "recipe_id", "ingredient_id"
+        ):
+            recipes.setdefault(recipe_id, set()).add(ingredient_id)
+        return recipes
+
+    def load(self):
+        recipes = {
+            pk: frozenset(ingredients)
+            for pk, ingredients in self.read_rows().items()
+        }
+        postings = {}
+        for pk, ingredients in recipes.items():
+            for ingredient in ingredients:
+                postings.setdefault(ingredient, set()).add(pk)
+        return recipes, postings
+
+    def refresh(self, index, recipe_ids):
+        """Copy of the index with the given recipes reloaded."""
+        recipes, postings = dict(index[0]), dict(index[1])
+        for pk, ingredients in self.read_rows(recipe_ids).items():
+            old = recipes.pop(pk, frozenset())
+            for ingredient in old - ingredients:
+                postings[ingredient] = postings[ingredient] - {pk}
+            for ingredient in ingredients - old:
+                postings[ingredient] = postings.get(ingredient, set()) | {pk}
+            if ingredients:
+                recipes[pk] = frozenset(ingredients)
+        return recipes, postings
+
+    def get_state(self):
+        state = cache.get_many([self.epoch_key, self.sequence_key])
+        if self.epoch_key not in state:
+            cache.add(self.epoch_key, uuid.uuid4().hex, None)
+            state = cache.get_many([self.epoch_key, self.sequence_key])
+        return state.get(self.epoch_key), state.get(self.sequence_key, 0)
+
+    def get_index(self):
+        epoch, sequence = self.get_state()
+        if self._index is not None and (epoch, sequence) == (
+            self._epoch,
+            self._sequence,
+        ):
+            return self._index
+        with self._lock:
+            if self._index is None or epoch != self._epoch:
+                self._index = self.load()
+            elif sequence != self._sequence:
+                self._index = self.replay(self._index, sequence)
+            self._epoch, self._sequence = epoch, sequence
+            return self._index
+
+    def replay(self, index, sequence):
+        if not 0 < sequence - self._sequence <= self.max_replay:
+            return self.load()
+        keys = [
+            self.change_key.format(number)
+            for number in range(self._sequence + 1, sequence + 1)
+        ]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):
+            return self.load()
+        return self.refresh(index, set(chain.from_iterable(changes.values())))
+
+    def match(self, ingredient_ids, max_missing=None):
+        """
+        (recipe id, matched, total) of recipes using any of the
+        ingredients, best covered first, as ``RankedMatches``.
+        """
+        recipes, postings = self.get_index()
+        matched = Counter(
+            chain.from_iterable(
+                postings.get(ingredient, ())
+                for ingredient in set(ingredient_ids)
+            )
+        )
+        return RankedMatches(
+            [
+                (pk, count, len(recipes[pk]))
+                for pk, count in matched.items()
+                if max_missing is None
+                or len(recipes[pk]) - count <= max_missing
+            ]
+        )
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
+# One change log entry per transaction, however many rows it touched.
+recipe_changes = CommitBatch(recipe_ingredient_index.record_change)
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+from recipes.duplicates import collapse_duplicates
+
+
+def collapse(apps, schema_editor):
+    collapse_duplicates(apps.get_model)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse, migrations.RunPython.noop),
+    ]
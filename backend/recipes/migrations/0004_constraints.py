@@ -0,0 +1,151 @@
+# Generated by Django 3.2.5 on 2026-10-18 04:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+POSTGRES_INDEXES = (
+    (
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        None,
+    ),
+    (
+        "CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm "
+        "ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)",
+        "DROP INDEX IF EXISTS recipes_ingredient_name_trgm",
+    ),
+    (
+        "CREATE INDEX IF NOT EXISTS recipes_ingredientrecipe_covering "
+        "ON recipes_ingredientrecipe (recipe_id, ingredient_id) "
+        "INCLUDE (amount)",
+        "DROP INDEX IF EXISTS recipes_ingredientrecipe_covering",
+    ),
+)
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for create, _ in POSTGRES_INDEXES:
+        schema_editor.execute(create)
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for _, drop in reversed(POSTGRES_INDEXES):
+        if drop:
+            schema_editor.execute(drop)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0003_collapse_duplicates"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="ingredientrecipe",
+            name="amount",
+            field=models.PositiveIntegerField(verbose_name="Количество"),
+        ),
+        migrations.AlterField(
+            model_name="ingredientrecipe",
+            name="ingredient",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="recipes.ingredient",
+                verbose_name="Ингредиент",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ingredientrecipe",
+            name="recipe",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to="recipes.recipe",
+                verbose_name="Рецепт",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="author",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Автор",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="cooking_time",
+            field=models.PositiveIntegerField(verbose_name="Время"),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                upload_to="recipes/images/",
+                verbose_name="Изображение",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="ingredients",
+            field=models.ManyToManyField(
+                blank=True,
+                through="recipes.IngredientRecipe",
+                to="recipes.Ingredient",
+                verbose_name="Ингредиенты",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="name",
+            field=models.CharField(max_length=256, verbose_name="Название"),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="tags",
+            field=models.ManyToManyField(
+                to="recipes.Tag", verbose_name="Тэги"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="recipe",
+            name="text",
+            field=models.TextField(verbose_name="Описание"),
+        ),
+        migrations.AddConstraint(
+            model_name="favorite",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipes"), name="unique_favorite"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="ingredient",
+            constraint=models.UniqueConstraint(
+                fields=("name", "measurement_unit"), name="unique_ingredient"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="ingredientrecipe",
+            constraint=models.UniqueConstraint(
+                fields=("recipe", "ingredient"),
+                name="unique_recipe_ingredient",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="shoppingcart",
+            constraint=models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_shopping_cart"
+            ),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.5 on 2026-10-18 04:14
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes.search import update_search_vectors
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector "
+        "ON recipes_recipe USING gin (search_vector)"
+    )
+    update_search_vectors()
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS recipes_recipe_search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0005_shoppinglistitem"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
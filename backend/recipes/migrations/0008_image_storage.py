@@ -0,0 +1,25 @@
+# Generated by Django 3.2.5 on 2026-10-18 04:22
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0007_image_renditions"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="recipe",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=recipes.storage.ContentAddressedStorage(),
+                upload_to="recipes/images/",
+                verbose_name="Изображение",
+            ),
+        ),
+    ]
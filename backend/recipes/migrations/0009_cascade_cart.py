@@ -0,0 +1,34 @@
+# Generated by Django 3.2.5 on 2026-10-18 04:56
+
+from django.conf import settings
+from django.db import migrations, models
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recipes", "0008_image_storage"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="shoppingcart",
+            name="recipe",
+            field=models.ForeignKey(
+                on_delete=recipes.models.cascade_cart,
+                to="recipes.recipe",
+                verbose_name="Рецепт",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="shoppingcart",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=recipes.models.cascade_cart,
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Пользователь",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.5 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0009_cascade_cart"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["author", "id"], name="recipe_author_latest"
+            ),
+        ),
+    ]
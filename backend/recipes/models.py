@@ -1,6 +1,13 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.db.models.expressions import RawSQL
+
+from users.models import Follow
+
+from .storage import image_storage
 
 User = get_user_model()
 
@@ -20,10 +27,89 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=256)
     measurement_unit = models.CharField(max_length=64)
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("name", "measurement_unit"), name="unique_ingredient"
+            ),
+        )
+
     def __str__(self) -> str:
         return "{},{}".format(self.name, self.measurement_unit)
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_relations(self):
+        return (
+            self.defer("search_vector")
+            .select_related("author")
+            .prefetch_related(
+                "tags",
+                Prefetch(
+                    "ingredientrecipe_set",
+                    queryset=IngredientRecipe.objects.select_related(
+                        "ingredient"
+                    ),
+                ),
+            )
+        )
+
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, models.BooleanField()),
+                is_in_shopping_cart=Value(False, models.BooleanField()),
+                is_author_subscribed=Value(False, models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipes=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_author_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef("author"))
+            ),
+        )
+
+    def latest_per_author(self, limit=None, authors=None):
+        """
+        Recipes newest first, of the given authors only, at most ``limit``
+        per author.
+
+        Rows are numbered per author by a window function over the
+        (author, id) index, so older recipes of prolific authors are never
+        looked up one by one.
+        """
+        queryset = self.defer("search_vector").order_by("-id")
+        if authors is not None:
+            authors = [getattr(author, "pk", author) for author in authors]
+            if not authors:
+                return queryset.none()
+            queryset = queryset.filter(author__in=authors)
+        if limit is None:
+            return queryset
+        condition, params = "", []
+        if authors is not None:
+            placeholders = ", ".join(["%s"] * len(authors))
+            condition, params = f"WHERE author_id IN ({placeholders})", authors
+        latest = RawSQL(
+            f"""
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY id DESC
+                ) AS position
+                FROM {Recipe._meta.db_table}
+                {condition}
+            ) ranked
+            WHERE position <= %s
+            """,
+            [*params, limit],
+        )
+        return queryset.filter(id__in=latest)
+
+
 class Recipe(models.Model):
 
     author = models.ForeignKey(
@@ -36,10 +122,14 @@ class Recipe(models.Model):
     name = models.CharField(max_length=256, verbose_name="Название")
     image = models.ImageField(
         upload_to="recipes/images/",
+        storage=image_storage,
         blank=True,
         null=True,
         verbose_name="Изображение",
     )
+    image_renditions = models.JSONField(
+        default=dict, blank=True, editable=False
+    )
     text = models.TextField(verbose_name="Описание")
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -49,6 +139,14 @@ class Recipe(models.Model):
     )
     tags = models.ManyToManyField(Tag, verbose_name="Тэги")
     cooking_time = models.PositiveIntegerField(verbose_name="Время")
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(fields=("author", "id"), name="recipe_author_latest"),
+        )
 
     def __str__(self) -> str:
         return self.name
@@ -70,6 +168,14 @@ class IngredientRecipe(models.Model):
         verbose_name="Количество",
     )
 
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=("recipe", "ingredient"),
+                name="unique_recipe_ingredient",
+            ),
+        )
+
 
 class Favorite(models.Model):
     recipes = models.ForeignKey(
@@ -83,16 +189,63 @@ class Favorite(models.Model):
 
     class Meta:
         verbose_name = "Избранное"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipes"), name="unique_favorite"
+            ),
+        )
+
+
+def cascade_cart(collector, field, sub_objs, using):
+    """
+    CASCADE marking cart rows deleted with their recipe or user.
+
+    Deleting a recipe updates every shopping list at once and a deleted
+    user's list goes away with the user, so these rows skip the update of
+    a single list.
+    """
+    sub_objs = list(sub_objs)
+    for cart in sub_objs:
+        cart.cascaded = True
+    models.CASCADE(collector, field, sub_objs, using)
 
 
 class ShoppingCart(models.Model):
 
     recipe = models.ForeignKey(
-        Recipe, on_delete=models.CASCADE, verbose_name="Рецепт"
+        Recipe, on_delete=cascade_cart, verbose_name="Рецепт"
     )
     user = models.ForeignKey(
-        User, on_delete=models.CASCADE, verbose_name="Пользователь"
+        User, on_delete=cascade_cart, verbose_name="Пользователь"
     )
 
     class Meta:
         verbose_name = "Список покупок"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"), name="unique_shopping_cart"
+            ),
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Running total of one ingredient in the user's shopping cart."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, verbose_name="Ингредиент"
+    )
+    amount = models.IntegerField(verbose_name="Количество")
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "ingredient"), name="unique_shopping_list_item"
+            ),
+        )
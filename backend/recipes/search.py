@@ -0,0 +1,163 @@
+import re
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+from .autocomplete import VersionedIndex
+from .models import Ingredient, IngredientRecipe, Recipe
+from .services import CommitBatch
+
+# Default ts_rank weights of the A (name), B (ingredients) and C (text)
+# labels, reused by the in-memory fallback so both rank alike.
+WEIGHTS = {"name": 1.0, "ingredients": 0.4, "text": 0.2}
+WORD = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return WORD.findall(text.casefold())
+
+
+def is_postgres():
+    return connection.vendor == "postgresql"
+
+
+def update_search_vectors(recipe_ids=None):
+    """
+    Recompute ``Recipe.search_vector`` of the given recipes, or of all of
+    them, from the name, the ingredient names and the description.
+    """
+    condition, params = "", []
+    if recipe_ids is not None:
+        condition, params = "WHERE recipe.id = ANY(%s)", [list(recipe_ids)]
+    config = settings.SEARCH_CONFIG
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {Recipe._meta.db_table} recipe SET search_vector =
+                setweight(to_tsvector(%s, recipe.name), 'A')
+                || setweight(to_tsvector(%s, coalesce((
+                    SELECT string_agg(ingredient.name, ' ')
+                    FROM {IngredientRecipe._meta.db_table} ir
+                    JOIN {Ingredient._meta.db_table} ingredient
+                        ON ingredient.id = ir.ingredient_id
+                    WHERE ir.recipe_id = recipe.id
+                ), '')), 'B')
+                || setweight(to_tsvector(%s, recipe.text), 'C')
+            {condition}
+            """,
+            [config, config, config, *params],
+        )
+
+
+class RecipeSearchIndex(VersionedIndex):
+    """
+    Inverted index of recipe words used where Postgres full-text search
+    is not available, e.g. in SQLite test runs.
+
+    Words are matched whole without stemming and scored with the same
+    weights as the search vector labels.
+    """
+
+    version_key = "recipe-search-version"
+
+    def load(self):
+        postings = defaultdict(lambda: defaultdict(float))
+        fields = [
+            (pk, "name", name)
+            for pk, name in Recipe.objects.values_list("id", "name")
+        ]
+        fields += [
+            (pk, "text", text)
+            for pk, text in Recipe.objects.values_list("id", "text")
+        ]
+        fields += [
+            (pk, "ingredients", name)
+            for pk, name in IngredientRecipe.objects.filter(
+                ingredient__isnull=False
+            ).values_list("recipe_id", "ingredient__name")
+        ]
+        for pk, field, text in fields:
+            for word in tokenize(text):
+                postings[word][pk] += WEIGHTS[field]
+        return {word: dict(scores) for word, scores in postings.items()}
+
+    def search(self, query, after=None):
+        """(rank, id) pairs matching every word, best first."""
+        postings = self.get_index()
+        words = set(tokenize(query))
+        if not words:
+            return []
+        matches = None
+        for word in words:
+            scores = postings.get(word, {})
+            matches = (
+                set(scores) if matches is None else matches & scores.keys()
+            )
+        keys = sorted(
+            (-sum(postings[word][pk] for word in words), -pk) for pk in matches
+        )
+        if after is not None:
+            rank, pk = after
+            position = bisect_right(keys, (-rank, -pk))
+            keys = keys[position:]
+        return [(-rank, -pk) for rank, pk in keys]
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def refresh_search(recipe_ids):
+    if is_postgres():
+        update_search_vectors(recipe_ids)
+    else:
+        recipe_search_index.invalidate()
+
+
+search_updates = CommitBatch(refresh_search)
+
+
+def schedule_search_update(recipe_ids):
+    """Refresh the search data of the recipes once the transaction ends."""
+    search_updates.add(recipe_ids)
+
+
+def search_recipes(queryset, query, after=None, limit=10):
+    """
+    Up to ``limit`` recipes of the queryset matching the query, best
+    ranked first, each with a ``search_rank`` attribute.
+
+    ``after`` is the (rank, id) of the last recipe of the previous page.
+    """
+    if is_postgres():
+        search_query = SearchQuery(query, config=settings.SEARCH_CONFIG)
+        # ts_rank returns a real, which never equals the double precision
+        # rank read back from a cursor, so ties would be skipped.
+        queryset = queryset.filter(search_vector=search_query).annotate(
+            search_rank=Cast(
+                SearchRank(F("search_vector"), search_query), FloatField()
+            )
+        )
+        if after is not None:
+            rank, pk = after
+            queryset = queryset.filter(
+                Q(search_rank__lt=rank) | Q(search_rank=rank, pk__lt=pk)
+            )
+        return list(queryset.order_by("-search_rank", "-pk")[:limit])
+    ranked = recipe_search_index.search(query, after)
+    page = []
+    for start in range(0, len(ranked), limit):
+        end = start + limit
+        chunk = ranked[start:end]
+        found = queryset.in_bulk([pk for _, pk in chunk])
+        for rank, pk in chunk:
+            if pk in found:
+                found[pk].search_rank = rank
+                page.append(found[pk])
+                if len(page) == limit:
+                    return page
+    return page
@@ -0,0 +1,151 @@
+import threading
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+
+class _Batch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.ids = set()
+        self.flushed = False
+
+    def is_queued(self):
+        # Rolling back drops the flush from the commit hooks.
+        hooks = transaction.get_connection().run_on_commit
+        return not self.flushed and any(
+            hook[1] == self.flush for hook in hooks
+        )
+
+    def flush(self):
+        if not self.flushed:
+            self.flushed = True
+            self.callback(self.ids)
+
+
+class CommitBatch:
+    """
+    Ids collected until the current transaction commits, then handed to
+    ``callback`` in a single call.
+
+    Cascades send a signal per row, so this keeps them to one statement
+    per transaction.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._local = threading.local()
+
+    def add(self, ids):
+        batch = getattr(self._local, "batch", None)
+        if batch is None or not batch.is_queued():
+            batch = self._local.batch = _Batch(self.callback)
+        batch.ids.update(ids)
+        # The flush runs once however often it is queued, and queueing it
+        # every time lets captured commit hooks, as in tests, run it.
+        transaction.on_commit(batch.flush)
+
+
+def get_shopping_list(user):
+    """
+    Shopping list of the user read from the precomputed totals.
+
+    Lines are keyed by ingredient, so the same name measured in different
+    units stays on separate lines.
+    """
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .values(
+            "amount",
+            name=F("ingredient__name"),
+            measurement_unit=F("ingredient__measurement_unit"),
+        )
+        .order_by("name", "measurement_unit")
+    )
+
+
+def aggregate_shopping_lists():
+    """Totals per (user, ingredient) recomputed from the carts."""
+    return (
+        IngredientRecipe.objects.filter(
+            ingredient__isnull=False, recipe__shoppingcart__isnull=False
+        )
+        .values("ingredient_id", user_id=F("recipe__shoppingcart__user"))
+        .annotate(amount=Sum("amount"))
+        .order_by()
+    )
+
+
+def shift_shopping_lists(recipe_id, sign, user_id=None):
+    """
+    Add (sign=1) or subtract (sign=-1) a recipe from shopping lists.
+
+    Applies to every user having the recipe in the cart, or only to
+    ``user_id``. The totals are updated with one upsert, so concurrent
+    changes of the same list do not overwrite each other.
+    """
+    item_table = ShoppingListItem._meta.db_table
+    condition = "cart.recipe_id = %s"
+    params = [sign, recipe_id]
+    if user_id is not None:
+        condition += " AND cart.user_id = %s"
+        params.append(user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {item_table} (user_id, ingredient_id, amount)
+            SELECT cart.user_id, ir.ingredient_id, %s * SUM(ir.amount)
+            FROM {ShoppingCart._meta.db_table} cart
+            JOIN {IngredientRecipe._meta.db_table} ir
+                ON ir.recipe_id = cart.recipe_id
+            WHERE {condition} AND ir.ingredient_id IS NOT NULL
+            GROUP BY cart.user_id, ir.ingredient_id
+            ON CONFLICT (user_id, ingredient_id) DO UPDATE
+            SET amount = {item_table}.amount + excluded.amount
+            """,
+            params,
+        )
+        if sign > 0 or not cursor.rowcount:
+            return
+    stale = ShoppingListItem.objects.filter(amount__lte=0)
+    if user_id is not None:
+        stale = stale.filter(user_id=user_id)
+    else:
+        stale = stale.filter(
+            user__in=ShoppingCart.objects.filter(recipe_id=recipe_id).values(
+                "user"
+            )
+        )
+    stale.delete()
+
+
+def add_relation(model, **fields):
+    """
+    Insert a (user, object) relation row in one statement.
+
+    Relies on the unique constraint of the model, so parallel requests
+    cannot create duplicates. Returns None when the row already exists.
+    """
+    try:
+        with transaction.atomic():
+            return model.objects.create(**fields)
+    except IntegrityError:
+        return None
+
+
+def remove_relation(model, **fields):
+    """Delete a relation row with a single DELETE, report if it existed."""
+    deleted, _ = model.objects.filter(**fields).delete()
+    return bool(deleted)
+
+
+@transaction.atomic
+def rebuild_shopping_lists():
+    """Replace all precomputed totals with ones recomputed from carts."""
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(**row) for row in aggregate_shopping_lists()),
+        batch_size=1000,
+    )
@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .autocomplete import ingredient_index
+from .images import schedule_renditions
+from .matching import recipe_changes
+from .models import Ingredient, IngredientRecipe, Recipe, ShoppingCart
+from .search import schedule_search_update
+from .services import shift_shopping_lists
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shift_shopping_lists(instance.recipe_id, 1, instance.user_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    if not getattr(instance, "cascaded", False):
+        shift_shopping_lists(instance.recipe_id, -1, instance.user_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    shift_shopping_lists(instance.pk, -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_recipe_search(sender, instance, **kwargs):
+    schedule_search_update([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def update_recipe_ingredients_search(sender, instance, **kwargs):
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def record_recipe_change(sender, instance, **kwargs):
+    recipe_changes.add([instance.pk])
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def record_recipe_ingredients_change(sender, instance, **kwargs):
+    recipe_changes.add([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(
+            IngredientRecipe.objects.filter(ingredient=instance).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def render_recipe_image(sender, instance, **kwargs):
+    schedule_renditions(instance)
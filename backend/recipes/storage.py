@@ -0,0 +1,63 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage naming files by the SHA-256 of their content.
+
+    Saving content that is already stored only touches the existing file
+    and returns its name, and a name always refers to the same bytes, so
+    the files can be served with long-lived immutable cache headers.
+    Files are never overwritten or renamed; orphans are removed by the
+    collect_images command.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        try:
+            # Saving again counts as a new file for collect_images.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return self._save(name, content)
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(
+            directory,
+            mode=self.directory_permissions_mode or 0o777,
+            exist_ok=True,
+        )
+        with tempfile.NamedTemporaryFile(
+            dir=directory, prefix=".upload-", delete=False
+        ) as file:
+            for chunk in content.chunks():
+                file.write(chunk)
+        os.chmod(file.name, self.file_permissions_mode or 0o644)
+        # Concurrent writers of the same content race harmlessly here.
+        os.replace(file.name, full_path)
+        return name
+
+
+image_storage = ContentAddressedStorage()
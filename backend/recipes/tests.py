@@ -1,3 +1,374 @@
-from django.test import TestCase
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from .autocomplete import IngredientPrefixIndex
+from .duplicates import report_duplicates
+from .management.commands.load_data import iter_json_array
+from .matching import RecipeIngredientIndex
+from .models import Ingredient, IngredientRecipe, Recipe
+from .storage import ContentAddressedStorage
+
+
+class IngredientPrefixIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ("Сахар", "сахарная пудра", "ванильный сахар", "соль"):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def setUp(self):
+        self.index = IngredientPrefixIndex()
+        self.index.get_index()
+
+    def search(self, query):
+        return [item["name"] for item in self.index.search(query)]
+
+    def test_prefix_matches_rank_before_contains_matches(self):
+        with self.assertNumQueries(0):
+            names = self.search("сах")
+        self.assertEqual(names, ["Сахар", "сахарная пудра", "ванильный сахар"])
+
+    def test_index_reloads_after_ingredient_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name="сахарин", measurement_unit="г")
+        self.assertIn("сахарин", self.search("сахари"))
+
+
+class RecipeIngredientIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(
+            username="author", email="author@foodgram.test"
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(name=f"ингредиент {number}")
+            for number in range(4)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=name, text="", cooking_time=1
+            )
+            for name in ("first", "second", "third")
+        ]
+        for recipe, ingredients in zip(
+            cls.recipes, ((0, 1), (0, 1, 2, 3), (3,))
+        ):
+            for number in ingredients:
+                IngredientRecipe.objects.create(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[number],
+                    amount=1,
+                )
+
+    def setUp(self):
+        cache.clear()
+        self.index = RecipeIngredientIndex()
+        self.index.get_index()
+
+    def match(self, numbers, max_missing=None):
+        ids = [self.ingredients[number].id for number in numbers]
+        return list(self.index.match(ids, max_missing))
+
+    def test_recipes_are_ranked_by_coverage(self):
+        first, second, third = self.recipes
+        with self.assertNumQueries(0):
+            results = self.match([0, 1, 3])
+        self.assertEqual(
+            results, [(first.id, 2, 2), (third.id, 1, 1), (second.id, 3, 4)]
+        )
+        self.assertEqual(self.match([0], max_missing=1), [(first.id, 1, 2)])
+
+    def test_pages_rank_only_up_to_their_end(self):
+        first, second, third = self.recipes
+        ids = [self.ingredients[number].id for number in (0, 1, 3)]
+        results = self.index.match(ids)
+        with mock.patch(
+            "recipes.matching.heapq.nsmallest", wraps=heapq.nsmallest
+        ) as nsmallest:
+            self.assertEqual(len(results), 3)
+            nsmallest.assert_not_called()
+            self.assertEqual(results[1:2], [(third.id, 1, 1)])
+            self.assertEqual(results[-1], (second.id, 3, 4))
+        self.assertEqual(
+            [call.args[0] for call in nsmallest.mock_calls], [2, 3]
+        )
+
+    def test_changes_are_replayed_without_full_reload(self):
+        first, second, third = self.recipes
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientRecipe.objects.filter(recipe=second).delete()
+            IngredientRecipe.objects.create(
+                recipe=third, ingredient=self.ingredients[2], amount=1
+            )
+        with mock.patch.object(self.index, "load") as load:
+            with self.assertNumQueries(1):
+                results = self.match([2, 3])
+        load.assert_not_called()
+        self.assertEqual(results, [(third.id, 2, 2)])
+
+    def test_lost_change_log_forces_full_reload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes[0].delete()
+        cache.delete(self.index.change_key.format(1))
+        self.assertEqual(self.match([0]), [(self.recipes[1].id, 1, 4)])
+
+
+class LoadDataTests(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+        Ingredient.objects.create(name="соль", measurement_unit="г")
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding="utf-8")
+        return path
+
+    def load(self, *paths, **options):
+        call_command("load_data", *paths, stdout=StringIO(), **options)
+        return set(
+            Ingredient.objects.exclude(name="соль").values_list(
+                "name", "measurement_unit"
+            )
+        )
+
+    def test_csv(self):
+        path = self.write("a.csv", "мука,г\nсоль,г\nмука,г\nбитая строка\n")
+        self.assertEqual(self.load(path), {("мука", "г")})
+        self.assertEqual(Ingredient.objects.filter(name="соль").count(), 1)
+
+    def test_json_with_either_field_names(self):
+        path = self.write(
+            "a.json",
+            json.dumps(
+                [
+                    {"name": "мука", "measurement_unit": "г"},
+                    {"title": "молоко", "dimension": "мл"},
+                ]
+            ),
+        )
+        self.assertEqual(self.load(path), {("мука", "г"), ("молоко", "мл")})
+
+    def test_explicit_format_overrides_extension(self):
+        lines = '{"name": "мука", "measurement_unit": "г"}\n\n'
+        lines += '{"title": "мука", "dimension": "г"}\n'
+        for name in ("a.jsonl", "b.txt", "c.json"):
+            with self.subTest(name=name):
+                Ingredient.objects.exclude(name="соль").delete()
+                path = self.write(name, lines)
+                self.assertEqual(
+                    self.load(path, format="jsonl"), {("мука", "г")}
+                )
+
+    def test_rows_are_deduplicated_across_files(self):
+        first = self.write("a.csv", "мука ,г\n")
+        second = self.write("b.jsonl", '{"name": "мука", "dimension": "г"}')
+        self.assertEqual(self.load(first, second), {("мука", "г")})
+
+    def test_dry_run_saves_nothing(self):
+        path = self.write("a.csv", "мука,г\n")
+        self.assertEqual(self.load(path, dry_run=True), set())
+
+    def test_json_arrays_are_decoded_in_chunks(self):
+        items = [
+            {"name": "мука, [высший] сорт", "measurement_unit": "г"},
+            {"title": "молоко", "dimension": "мл", "extra": [1, {"a": 2}]},
+            12345,
+        ]
+        text = " [\n" + " ,\n ".join(json.dumps(i) for i in items) + "]\n"
+        file = StringIO(text)
+        file.name = "a.json"
+        decoded = iter_json_array(file, chunk_size=7)
+        self.assertEqual(next(decoded), items[0])
+        self.assertLess(file.tell(), len(text))
+        self.assertEqual(list(decoded), items[1:])
+        for broken in ("", "{}", "[1 2]", '[{"name": "мука"'):
+            with self.subTest(broken=broken):
+                file = StringIO(broken)
+                file.name = "a.json"
+                with self.assertRaises((CommandError, ValueError)):
+                    list(iter_json_array(file, chunk_size=3))
+
+
+class CollapseDuplicatesTests(TransactionTestCase):
+    """Migration 0003 on data written before the unique constraints."""
+
+    before = [("recipes", "0002_initial")]
+    after = [("recipes", "0003_collapse_duplicates")]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.apps = executor.loader.project_state(self.before).apps
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def seed(self):
+        get_model = self.apps.get_model
+        user, cook = (
+            get_model("users", "User").objects.create(
+                username=name, email=f"{name}@foodgram.test"
+            )
+            for name in ("author", "cook")
+        )
+        ingredient = get_model("recipes", "Ingredient").objects
+        salt, salt_again, milk = (
+            ingredient.create(name=name, measurement_unit=unit)
+            for name, unit in (("соль", "г"), ("соль", "г"), ("молоко", "мл"))
+        )
+        recipe = get_model("recipes", "Recipe").objects.create(
+            author=user, name="Суп", text="Суп", cooking_time=10
+        )
+        for item, amount in ((salt, 2), (salt_again, 3), (milk, 1), (milk, 1)):
+            get_model("recipes", "IngredientRecipe").objects.create(
+                recipe=recipe, ingredient=item, amount=amount
+            )
+        for _ in range(2):
+            get_model("recipes", "Favorite").objects.create(
+                user=cook, recipes=recipe
+            )
+            get_model("recipes", "ShoppingCart").objects.create(
+                user=cook, recipe=recipe
+            )
+        return recipe, salt, milk
+
+    def test_duplicates_are_reported_and_merged(self):
+        recipe, salt, milk = self.seed()
+        self.assertEqual(
+            report_duplicates(self.apps.get_model),
+            {
+                "ingredients": 1,
+                "recipe ingredients": 1,
+                "favorites": 1,
+                "shopping cart": 1,
+            },
+        )
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        self.assertEqual(
+            set(
+                apps.get_model("recipes", "IngredientRecipe")
+                .objects.filter(recipe_id=recipe.id)
+                .values_list("ingredient_id", "amount")
+            ),
+            {(salt.id, 5), (milk.id, 2)},
+        )
+        self.assertEqual(
+            apps.get_model("recipes", "Ingredient").objects.count(), 2
+        )
+        for name in ("Favorite", "ShoppingCart"):
+            self.assertEqual(
+                apps.get_model("recipes", name).objects.count(), 1
+            )
+        self.assertEqual(set(report_duplicates(apps.get_model).values()), {0})
+
+    def test_command_reports_clean_tables(self):
+        self.migrate_to_latest()
+        stdout = StringIO()
+        call_command("collapse_duplicates", "--dry-run", stdout=stdout)
+        self.assertIn("ingredients: 0 duplicate rows", stdout.getvalue())
+        self.assertNotIn("removed", stdout.getvalue())
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_same_content_is_written_once(self):
+        first = self.storage.save("images/a.PNG", ContentFile(b"photo"))
+        with mock.patch.object(self.storage, "_save") as save:
+            second = self.storage.save("images/b.png", ContentFile(b"photo"))
+        save.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertRegex(first, r"^images/[0-9a-f]{64}\.png$")
+        self.assertEqual(self.storage.listdir("images"), ([], [first[7:]]))
+
+    def test_saving_again_refreshes_modification_time(self):
+        name = self.storage.save("images/a.png", ContentFile(b"photo"))
+        os.utime(self.storage.path(name), (0, 0))
+        self.storage.save("images/b.png", ContentFile(b"photo"))
+        self.assertGreater(
+            os.path.getmtime(self.storage.path(name)), time.time() - 60
+        )
+
+    def test_different_content_gets_another_name(self):
+        first = self.storage.save("images/a.png", ContentFile(b"photo"))
+        second = self.storage.save("images/a.png", ContentFile(b"other"))
+        self.assertNotEqual(first, second)
+        with self.storage.open(second) as file:
+            self.assertEqual(file.read(), b"other")
+
+
+class SeedDataTests(TestCase):
+    def seed(self, prefix, **options):
+        call_command(
+            "seed_data",
+            users=30,
+            recipes=60,
+            ingredients=40,
+            prefix=prefix,
+            stdout=StringIO(),
+            **options,
+        )
+        return [
+            (
+                user.favorite_set.count(),
+                user.shoppingcart_set.count(),
+                user.followers.count(),
+            )
+            for user in get_user_model()
+            .objects.filter(username__startswith=prefix)
+            .order_by("id")
+        ]
+
+    def test_same_seed_gives_same_data(self):
+        first = self.seed("first-")
+        self.assertEqual(first, self.seed("second-"))
+        self.assertNotEqual(first, self.seed("third-", seed=1))
+
+    def test_authorship_is_skewed(self):
+        self.seed("seed-")
+        recipes = Counter(
+            Recipe.objects.filter(
+                author__username__startswith="seed-"
+            ).values_list("author", flat=True)
+        )
+        self.assertGreater(max(recipes.values()), 3 * 60 / 30)
+
+    def test_derived_data_is_consistent(self):
+        self.seed("seed-")
+        call_command("rebuild_shopping_lists", check=True, stdout=StringIO())
+        self.assertEqual(
+            IngredientRecipe.objects.values("recipe").distinct().count(), 60
+        )
+
+    def test_clear_replaces_seeded_data(self):
+        self.seed("seed-")
+        self.seed("seed-", clear=True)
+        self.assertEqual(
+            Recipe.objects.filter(
+                author__username__startswith="seed-"
+            ).count(),
+            60,
+        )